@@ -49,12 +49,27 @@ X_AXIS_TICK_INTERVAL = 5
 # dates for vertical dotted lines
 highlight_dates = ["25.01.2024", "21.03.2024"]
 
-# load the CSV file
-file_path = '4.5-DATE_Essendon_2024_all_symptom_date_70_treatment_sliding_window_Haversine_800m_FET_v1-PVAL-OR-CP_IN-OUT_report.csv'
-df = pd.read_csv(file_path)
-
-# convert timestamp to datetime format
-df['Timestamp'] = pd.to_datetime(df['Timestamp'], dayfirst=True, errors='coerce')
+# optional columnar results store (None reads the CSV report below)
+RESULTS_STORE = None
+RESULTS_RUN = 'Essendon_2024_symptom_70'
+RESULTS_REGION = 'Inner_northwest'
+RESULTS_RADIUS_M = 800
+
+if RESULTS_STORE is not None:
+    from results_store_v1 import read_windows, epoch_to_local_dates
+
+    # read only the columns of this plot from one run, region and radius
+    df = read_windows(RESULTS_STORE, columns=['Timestamp', 'In treatment zone', 'In control zone', 'TOTAL'],
+                      run=RESULTS_RUN, region=RESULTS_REGION, radius_m=RESULTS_RADIUS_M)
+    df = df.sort_values('Timestamp').reset_index(drop=True)
+    df['Timestamp'] = epoch_to_local_dates(df['Timestamp'])
+else:
+    # load the CSV file
+    file_path = '4.5-DATE_Essendon_2024_all_symptom_date_70_treatment_sliding_window_Haversine_800m_FET_v1-PVAL-OR-CP_IN-OUT_report.csv'
+    df = pd.read_csv(file_path)
+
+    # convert timestamp to datetime format
+    df['Timestamp'] = pd.to_datetime(df['Timestamp'], dayfirst=True, errors='coerce')
 
 # find timestamps that match the highlight dates
 highlight_indices = df[df['Timestamp'].dt.strftime('%d.%m.%Y').isin(highlight_dates)].index.tolist()
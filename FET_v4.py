@@ -8,6 +8,13 @@ from statsmodels.stats.proportion import proportion_confint
 # Set the zone radius (in km)
 ZONE_RADIUS_KM = 0.8 
 
+# p-value test: 'fisher', or 'barnard', 'boschloo' or 'midp' (read from a lookup built by unconditional_exact_lookup_v1.py)
+TEST_METHOD = 'fisher'
+PVALUE_LOOKUP_FILE = None
+
+# distance mode: 'geodesic' (geopy for every case-site pair) or 'hybrid' (spherical screening, exact near the boundaries)
+DISTANCE_MODE = 'geodesic'
+
 # calculate Haversine distances
 def haversine_distances(sample_coords, site_coords):
     return np.array([
@@ -15,8 +22,149 @@ def haversine_distances(sample_coords, site_coords):
         for lat1, lon1 in sample_coords
     ])
 
+# mean Earth radius (km) for the spherical distances
+EARTH_RADIUS_KM = 6371.0088
+
+# vectorized spherical (great-circle) distances, for screening and scans where geodesic accuracy is not needed
+def spherical_distances(sample_coords, site_coords):
+    lat1 = np.radians(np.asarray(sample_coords, dtype=float)[:, 0])[:, None]
+    lon1 = np.radians(np.asarray(sample_coords, dtype=float)[:, 1])[:, None]
+    lat2 = np.radians(np.asarray(site_coords, dtype=float)[:, 0])[None, :]
+    lon2 = np.radians(np.asarray(site_coords, dtype=float)[:, 1])[None, :]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+# largest relative difference between spherical and WGS84 geodesic distances (about 0.56%), rounded up
+GEODESIC_TOLERANCE = 0.006
+
+# refined distances closer than this (km) to the zone radius or to a nearest-arm tie are re-checked with geopy
+EXACT_BAND_KM = 1e-6
+
+# WGS84 ellipsoid (km)
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+
+# vectorized Vincenty inverse distances on the WGS84 ellipsoid (agrees with geopy's geodesic to well below a millimetre here)
+def vincenty_distances(sample_coords, site_coords, max_iterations=200):
+    b_km = (1 - WGS84_F) * WGS84_A_KM
+    lat1 = np.radians(np.asarray(sample_coords, dtype=float)[:, 0])[:, None]
+    lon1 = np.radians(np.asarray(sample_coords, dtype=float)[:, 1])[:, None]
+    lat2 = np.radians(np.asarray(site_coords, dtype=float)[:, 0])[None, :]
+    lon2 = np.radians(np.asarray(site_coords, dtype=float)[:, 1])[None, :]
+
+    u1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    u2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+    lon_diff = (lon2 - lon1) * np.ones_like(lat1 + lat2)
+    lam = lon_diff.copy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma > 0, cos_u1 * cos_u2 * sin_lam / sin_sigma, 0.0)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha > 0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha, 0.0)
+            c = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            lam_previous = lam
+            lam = lon_diff + (1 - c) * WGS84_F * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            if np.all(np.abs(lam - lam_previous) < 1e-12):
+                break
+
+    u_sq = cos2_alpha * (WGS84_A_KM ** 2 - b_km ** 2) / b_km ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    return b_km * big_a * (sigma - delta_sigma)
+
+# rows (cases) whose zone flag or nearest arm could change within the given relative and absolute distance error
+def _ambiguous_cases(treatment_distances, control_distances, relative_error, absolute_error):
+    min_treatment = treatment_distances.min(axis=1)
+    min_control = control_distances.min(axis=1)
+    error_treatment = relative_error * min_treatment + absolute_error
+    error_control = relative_error * min_control + absolute_error
+    return ((np.abs(min_treatment - ZONE_RADIUS_KM) <= error_treatment)
+            | (np.abs(min_control - ZONE_RADIUS_KM) <= error_control)
+            | (np.abs(min_treatment - min_control) <= error_treatment + error_control))
+
+# spherical distances for every pair, Vincenty for cases near the zone radius or a nearest-arm tie,
+# and geopy for the few that are still within EXACT_BAND_KM after that, so the classification matches the geodesic path
+def hybrid_distances(case_coords, treatment_coords, control_coords):
+    case_coords = np.asarray(case_coords, dtype=float)
+    treatment_distances = spherical_distances(case_coords, treatment_coords)
+    control_distances = spherical_distances(case_coords, control_coords)
+
+    refine = np.flatnonzero(_ambiguous_cases(treatment_distances, control_distances, GEODESIC_TOLERANCE, EXACT_BAND_KM))
+    if refine.size:
+        treatment_distances[refine] = vincenty_distances(case_coords[refine], treatment_coords)
+        control_distances[refine] = vincenty_distances(case_coords[refine], control_coords)
+
+        exact = refine[_ambiguous_cases(treatment_distances[refine], control_distances[refine], 0.0, EXACT_BAND_KM)]
+        if exact.size:
+            treatment_distances[exact] = haversine_distances(case_coords[exact], treatment_coords)
+            control_distances[exact] = haversine_distances(case_coords[exact], control_coords)
+    return treatment_distances, control_distances
+
+# assign each case to its nearest arm (True for treatment) and flag whether it lies within that arm's zone
+def classify_cases(case_coords, treatment_coords, control_coords, distance_mode=None):
+    if (distance_mode or DISTANCE_MODE) == 'hybrid':
+        treatment_distances, control_distances = hybrid_distances(case_coords, treatment_coords, control_coords)
+    else:
+        treatment_distances = haversine_distances(case_coords, treatment_coords)
+        control_distances = haversine_distances(case_coords, control_coords)
+
+    nearest_treatment = treatment_distances.min(axis=1) < control_distances.min(axis=1)
+    nearest_distance = np.where(nearest_treatment, treatment_distances.min(axis=1), control_distances.min(axis=1))
+    return nearest_treatment, nearest_distance <= ZONE_RADIUS_KM
+
+# metres per degree of latitude, and of longitude at the equator (same approximation as the Fig. 1B scale bar)
+METERS_PER_DEGREE_LAT = 110574
+METERS_PER_DEGREE_LON = 111320
+
+# cell size in degrees and shape (ny, nx) of a local grid over a bounding box (min_lon, max_lon, min_lat, max_lat);
+# cells are square in metres
+def raster_shape(bbox, cell_m):
+    min_lon, max_lon, min_lat, max_lat = bbox
+    lat_mid = (min_lat + max_lat) / 2.0
+    cell_lon = cell_m / (METERS_PER_DEGREE_LON * np.cos(np.radians(lat_mid)))
+    cell_lat = cell_m / METERS_PER_DEGREE_LAT
+    nx = int(np.ceil((max_lon - min_lon) / cell_lon))
+    ny = int(np.ceil((max_lat - min_lat) / cell_lat))
+    return ny, nx, cell_lat, cell_lon
+
+# seconds per day
+DAY_SECONDS = 86400
+
+# timezone of the unix times in the case and trap files; most are local midnights, a few cases are at 17:00 or 18:00
+LOCAL_TIMEZONE = 'Australia/Melbourne'
+
+# local (timezone naive) datetimes of unix times (scalar, array or Series)
+def local_datetimes(unix_times):
+    times = pd.to_datetime(unix_times, unit='s', utc=True)
+    if isinstance(times, pd.Series):
+        return times.dt.tz_convert(LOCAL_TIMEZONE).dt.tz_localize(None)
+    return times.tz_convert(LOCAL_TIMEZONE).tz_localize(None)
+
+# sliding windows of the window reports: a window starts every STEP_DAYS days and holds the cases with
+# START <= unix_time <= END (as in main), where END = START + (WINDOW_DAYS + 1) days (END - START is 71 days in the 70 day
+# 4.5-DATE_Essendon_2024 report)
+WINDOW_DAYS = 70
+STEP_DAYS = 1
+
+# (START, END) unix times of the sliding windows between start_unix and end_unix
+def sliding_windows(start_unix, end_unix, window_days=WINDOW_DAYS, step_days=STEP_DAYS):
+    span = (window_days + 1) * DAY_SECONDS
+    starts = np.arange(start_unix, end_unix - span + 1, step_days * DAY_SECONDS)
+    return starts, starts + span
+
 # compute Fisher’s exact test for a given start and end unix time
-def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix):
+def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, zone_grid_file=None):
     # Load data
     cases = pd.read_csv(cases_file)
     treatment_sites = pd.read_csv(treatment_sites_file)
@@ -36,22 +184,22 @@ def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_u
     treatment_coords = treatment_sites[['lat', 'lon']].to_numpy()
     control_coords = control_sites[['lat', 'lon']].to_numpy()
 
-    # compute distances to treatment and control sites
-    treatment_distances = haversine_distances(cases_window[['lat', 'lon']].to_numpy(), treatment_coords)
-    control_distances = haversine_distances(cases_window[['lat', 'lon']].to_numpy(), control_coords)
-
-    # assign each case to the nearest zone (treatment or control)
-    cases_window['nearest_zone'] = np.where(
-        treatment_distances.min(axis=1) < control_distances.min(axis=1), 'Treatment', 'Control'
-    )
+    # assign each case to the nearest zone (treatment or control) and determine if it is within that zone,
+    # either from distances to every site or from a precomputed zone lookup grid
+    case_coords = cases_window[['lat', 'lon']].to_numpy()
+    if zone_grid_file is not None:
+        from zone_lookup_grid_v1 import load_zone_grid, classify_with_grid
+        zone_grid = load_zone_grid(zone_grid_file, treatment_coords, control_coords)
+        nearest_treatment, within_zone = classify_with_grid(zone_grid, case_coords, treatment_coords, control_coords)
+    else:
+        nearest_treatment, within_zone = classify_cases(case_coords, treatment_coords, control_coords)
 
-    # determine if cases are within the treatment or control zone
-    cases_window['within_treatment_zone'] = (treatment_distances.min(axis=1) <= ZONE_RADIUS_KM).astype(int)
-    cases_window['within_control_zone'] = (control_distances.min(axis=1) <= ZONE_RADIUS_KM).astype(int)
+    cases_window['nearest_zone'] = np.where(nearest_treatment, 'Treatment', 'Control')
+    cases_window['within_zone'] = within_zone.astype(int)
 
     # count cases within each zone
-    treatment_counts = cases_window[cases_window['nearest_zone'] == 'Treatment']['within_treatment_zone'].value_counts().reindex([1, 0], fill_value=0)
-    control_counts = cases_window[cases_window['nearest_zone'] == 'Control']['within_control_zone'].value_counts().reindex([1, 0], fill_value=0)
+    treatment_counts = cases_window[cases_window['nearest_zone'] == 'Treatment']['within_zone'].value_counts().reindex([1, 0], fill_value=0)
+    control_counts = cases_window[cases_window['nearest_zone'] == 'Control']['within_zone'].value_counts().reindex([1, 0], fill_value=0)
 
     # total number of unique cases in the window
     total_cases_in_window = cases_window.shape[0]
@@ -76,6 +224,14 @@ def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_u
     # do Fisher’s exact test
     odds_ratio_fisher, p_value = fisher_exact(contingency_table)
 
+    # optionally replace the p-value with an unconditional exact or mid-p test
+    if TEST_METHOD != 'fisher':
+        from unconditional_exact_lookup_v1 import load_lookup, lookup_pvalues, direct_pvalue
+        if PVALUE_LOOKUP_FILE is not None:
+            p_value = lookup_pvalues(TEST_METHOD, load_lookup(PVALUE_LOOKUP_FILE, TEST_METHOD), [a], [b], [c], [d])[0]
+        else:
+            p_value = direct_pvalue(TEST_METHOD, a, b, c, d)
+
     # use exact method from statsmodels for odds ratio and the 95% CI
     from statsmodels.stats.contingency_tables import Table2x2
     table2x2 = Table2x2(contingency_table)
@@ -132,14 +288,17 @@ def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_u
     print("Total Unique Cases in Window:", total_cases_in_window)
     print("----------------------------------------------------")
     print(f"Odds Ratio: {odds_ratio:.3f} (95% CI: {ci_lower:.3f} - {ci_upper:.3f})")
-    print(f"P-value: {p_value:.5f}")
+    if TEST_METHOD == 'fisher':
+        print(f"P-value: {p_value:.5f}")
+    else:
+        print(f"P-value ({TEST_METHOD}): {p_value:.5f}")
     print(f"Cases Prevented: {cases_prevented:.1f} (95% CI: {cases_prevented_low:.1f} - {cases_prevented_upp:.1f})")
     print(f"Interpretation: {interpretation}")
     print(final_statement)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 6:
-        print("Usage: python script.py <cases_file> <treatment_sites_file> <control_sites_file> <start_unix> <end_unix>")
+    if len(sys.argv) not in (6, 7):
+        print("Usage: python script.py <cases_file> <treatment_sites_file> <control_sites_file> <start_unix> <end_unix> [zone_grid_file]")
         sys.exit(1)
 
     cases_file = sys.argv[1]
@@ -147,5 +306,6 @@ if __name__ == "__main__":
     control_sites_file = sys.argv[3]
     start_unix = int(sys.argv[4])
     end_unix = int(sys.argv[5])
+    zone_grid_file = sys.argv[6] if len(sys.argv) == 7 else None
 
-    main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix)
+    main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, zone_grid_file)
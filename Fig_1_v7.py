@@ -10,6 +10,7 @@ import matplotlib.font_manager as fm
 from matplotlib.patches import Patch
 import matplotlib.patheffects as pe
 import numpy as np
+from case_density_raster_v1 import case_density, plot_density
 
 treatment_circle_colour = 'red'
 control_circle_colour = 'blue'
@@ -24,6 +25,23 @@ heatmap_high_colour = 'darkred'
 
 custom_cmap = LinearSegmentedColormap.from_list("custom_heatmap", [heatmap_low_colour, middle_heatmap_colour, heatmap_high_colour])
 
+# case density raster (FFT-smoothed, no meshblock spatial join)
+density_raster = False
+density_cell_m = 25
+density_bandwidth_m = 200
+density_alpha = 0.7
+
+# animation of Fig. 1B across the sliding windows (static layers are drawn once, only the case layer changes)
+animate_windows = False
+animation_window_days = 70
+animation_step_days = 1
+animation_dpi = 100
+animation_frame_dir = 'Fig1_B_frames'
+animation_video = 'Fig1_B_animation.mp4'
+animation_fps = 12
+case_marker_colour = heatmap_high_colour
+case_marker_size = 40
+
 # basemap
 basemap_source = ctx.providers.OpenStreetMap.Mapnik
 
@@ -94,38 +112,12 @@ polygon_label_offset_factor = 0.02
 meshblock_shp_path = '1270055001_mb_2011_vic_shape/MB_2011_VIC.shp'
 cases_csv_path = 'Inner_northwest_2024_cases_symptom.csv'
 
-# read the meshblock shapefile
-meshblocks = gpd.read_file(meshblock_shp_path)
-
-# read csv of cases and create a GeoDataFrame
+# read csv of cases
 cases = pd.read_csv(cases_csv_path)
-geometry = [Point(xy) for xy in zip(cases['lon'], cases['lat'])]
-cases_gdf = gpd.GeoDataFrame(cases, geometry=geometry, crs="EPSG:4326")
-
-# make both GeoDataFrames use the same CRS
-if meshblocks.crs != cases_gdf.crs:
-    cases_gdf = cases_gdf.to_crs(meshblocks.crs)
-
-# determine which meshblock each case falls within.
-cases_with_mesh = gpd.sjoin(cases_gdf, meshblocks, how='left', predicate='within')
-
-# count the number of cases per meshblock
-if 'mesh_id' in meshblocks.columns:
-    counts = cases_with_mesh.groupby('mesh_id').size().reset_index(name='case_count')
-    meshblocks = meshblocks.merge(counts, on='mesh_id', how='left')
-else:
-    counts = cases_with_mesh.groupby('index_right').size().reset_index(name='case_count')
-    meshblocks = meshblocks.merge(counts, left_index=True, right_on='index_right', how='left')
 
-meshblocks['case_count'] = meshblocks['case_count'].fillna(0).astype(int)
-
-# filter only meshblocks that have at least one case
-meshblocks_cases = meshblocks[meshblocks['case_count'] > 0]
-
-# define the mapping area (bounding box) and clip the data accordingly.
+# define the mapping area (bounding box)
 min_lon, max_lon = 144.86, 144.986887
 min_lat, max_lat = -37.785, -37.714593
-meshblocks_cases_clipped = meshblocks_cases.cx[min_lon:max_lon, min_lat:max_lat]
 
 # Classify meshblocks into discrete case categories
 def classify_cases(count):
@@ -136,7 +128,39 @@ def classify_cases(count):
     else:
         return '3+ cases'
 
-meshblocks_cases_clipped['case_category'] = meshblocks_cases_clipped['case_count'].apply(classify_cases)
+# the meshblock layer needs a spatial join of every case, the density raster does not
+if not density_raster:
+    # read the meshblock shapefile
+    meshblocks = gpd.read_file(meshblock_shp_path)
+
+    # create a GeoDataFrame of the cases
+    geometry = [Point(xy) for xy in zip(cases['lon'], cases['lat'])]
+    cases_gdf = gpd.GeoDataFrame(cases, geometry=geometry, crs="EPSG:4326")
+
+    # make both GeoDataFrames use the same CRS
+    if meshblocks.crs != cases_gdf.crs:
+        cases_gdf = cases_gdf.to_crs(meshblocks.crs)
+
+    # determine which meshblock each case falls within.
+    cases_with_mesh = gpd.sjoin(cases_gdf, meshblocks, how='left', predicate='within')
+
+    # count the number of cases per meshblock
+    if 'mesh_id' in meshblocks.columns:
+        counts = cases_with_mesh.groupby('mesh_id').size().reset_index(name='case_count')
+        meshblocks = meshblocks.merge(counts, on='mesh_id', how='left')
+    else:
+        counts = cases_with_mesh.groupby('index_right').size().reset_index(name='case_count')
+        meshblocks = meshblocks.merge(counts, left_index=True, right_on='index_right', how='left')
+
+    meshblocks['case_count'] = meshblocks['case_count'].fillna(0).astype(int)
+
+    # filter only meshblocks that have at least one case
+    meshblocks_cases = meshblocks[meshblocks['case_count'] > 0]
+
+    # clip the meshblocks to the mapping area
+    meshblocks_cases_clipped = meshblocks_cases.cx[min_lon:max_lon, min_lat:max_lat]
+
+    meshblocks_cases_clipped['case_category'] = meshblocks_cases_clipped['case_count'].apply(classify_cases)
 
 # define discrete colours for each category
 category_colors = {
@@ -195,6 +219,12 @@ ax.set_ylim(min_lat, max_lat)
 # add basemap.
 ctx.add_basemap(ax, source=basemap_source, crs="EPSG:4326", zorder=0)
 
+# plot the case density raster under the site buffers
+if density_raster:
+    density_bbox = (min_lon, max_lon, min_lat, max_lat)
+    density = case_density(cases, density_bbox, density_cell_m, density_bandwidth_m)
+    density_image = plot_density(ax, density, custom_cmap, density_bbox, density_cell_m, alpha=density_alpha, zorder=0.5)
+
 # plot site buffers
 control_buffers.plot(ax=ax, color=buffer_fill_color, alpha=buffer_alpha,
                      edgecolor=buffer_fill_color, zorder=1)
@@ -247,6 +277,8 @@ legend_handles = [
 #    Patch(facecolor=meshblock_colour_2_cases, edgecolor='black', label='2 cases'),
 #    Patch(facecolor=meshblock_colour_3_cases, edgecolor='black', label='3 cases')
 ]
+if density_raster:
+    legend_handles.append(Patch(facecolor=heatmap_high_colour, edgecolor=heatmap_high_colour, alpha=density_alpha, label='Case density'))
 ax.legend(handles=legend_handles, loc=legend_loc, bbox_to_anchor=legend_bbox,
           prop={'size': legend_fontsize})
 
@@ -299,4 +331,27 @@ output_png = 'output_figure.png'
 plt.savefig(output_svg, format='svg')
 plt.savefig(output_png, format='png', dpi=300)
 
+# animate the case layer across the sliding windows, reusing the static layers drawn above
+if animate_windows:
+    from FET_v4 import sliding_windows
+    from map_animation_v1 import animate_case_windows, encode_video
+
+    cases['unix_time'] = pd.to_numeric(cases['unix_time'], errors='coerce')
+    window_starts, window_ends = sliding_windows(int(cases['unix_time'].min()), int(cases['unix_time'].max()),
+                                                 animation_window_days, animation_step_days)
+    density_frames = None
+    density_max = None
+    if density_raster:
+        from case_density_raster_v1 import window_frames
+        # one pass for the shared colour scale, then the frames are smoothed again chunk by chunk while drawing
+        frame_args = (cases, window_starts, window_ends, density_bbox, density_cell_m, density_bandwidth_m)
+        density_max = max(frame.max() for frame in window_frames(*frame_args))
+        density_frames = window_frames(*frame_args)
+
+    animate_case_windows(fig, ax, cases, window_starts, window_ends, animation_frame_dir,
+                         case_marker_colour, case_marker_size,
+                         density_image=density_image if density_raster else None,
+                         density_frames=density_frames, density_max=density_max, dpi=animation_dpi)
+    encode_video(animation_frame_dir, animation_video, animation_fps)
+
 plt.show()
@@ -41,6 +41,24 @@ data[columns_to_process] = data[columns_to_process].apply(pd.to_numeric, errors=
 # convert timestamp column to datetime
 data['Timestamp'] = pd.to_datetime(data['Timestamp'], format='%d.%m.%Y', errors='coerce')
 
+# optional columnar results store (None keeps treatment_mean_diff from the CSV): the daily egg counts are not window
+# outputs and stay in the CSV, while treatment_mean_diff is the CP of the windows of one run, region and radius
+RESULTS_STORE = None
+RESULTS_RUN = 'Essendon_2024_symptom_70'
+RESULTS_REGION = 'Inner_northwest'
+RESULTS_RADIUS_M = 800
+
+if RESULTS_STORE is not None:
+    from results_store_v1 import read_windows, epoch_to_local_dates
+
+    # read only the window dates and CP, and match them to the egg count days (the first window of a repeated date)
+    windows = read_windows(RESULTS_STORE, columns=['Timestamp', 'START', 'CP'],
+                           run=RESULTS_RUN, region=RESULTS_REGION, radius_m=RESULTS_RADIUS_M)
+    windows = windows.sort_values('START').drop_duplicates('Timestamp')
+    windows['Timestamp'] = epoch_to_local_dates(windows['Timestamp']).dt.normalize()
+    data = data.drop(columns='treatment_mean_diff').merge(
+        windows[['Timestamp', 'CP']].rename(columns={'CP': 'treatment_mean_diff'}), on='Timestamp', how='left')
+
 # log the egg counts
 data['egg_counts_diff_logged'] = np.log1p(data['egg_counts_diff'])  # log(x+1) to handle zeros safely
 
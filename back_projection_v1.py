@@ -0,0 +1,154 @@
+import sys
+import numpy as np
+import pandas as pd
+from scipy.signal import fftconvolve
+from scipy.stats import lognorm, norm
+from FET_v4 import DAY_SECONDS, WINDOW_DAYS, STEP_DAYS, local_datetimes
+from chunked_aggregation_v1 import CELLS, aggregate_case_counts, daily_counts, daily_window_tables, window_statistics
+from results_store_v1 import local_dates_to_epoch, write_windows
+
+# incubation period (days from exposure to symptom onset) IQR, as in the Fig. 3B exposure date axis
+INCUBATION_Q1_DAYS = 101
+INCUBATION_Q3_DAYS = 171
+
+# longest incubation period considered (days); exposure curves start this many days before the first onset day
+MAX_INCUBATION_DAYS = 365
+
+# Richardson-Lucy (EM) iterations, stopping early once the largest relative change is below the tolerance
+MAX_ITERATIONS = 200
+TOLERANCE = 1e-6
+
+# exposure days are only estimated when at least this share of their cases would have an onset inside the observed onset
+# days; the rest are held at zero, since dividing by a small share blows their estimates up
+MIN_SENSITIVITY = 0.5
+
+# the back-projected exposure total is checked against the observed onsets, warning when it differs by more than this share
+# (it exceeds the onsets by the cases expected to fall ill after the last onset day)
+TOTAL_TOLERANCE = 0.5
+
+# Poisson bootstrap replicates of the onset counts for the exposure curve intervals, and the interval level
+N_BOOTSTRAP = 200
+CI_LEVEL = 0.95
+BOOTSTRAP_SEED = 1
+
+# discretised lognormal incubation distribution with the given quartiles; pmf[k] = P(incubation of k days)
+def incubation_pmf(q1=INCUBATION_Q1_DAYS, q3=INCUBATION_Q3_DAYS, max_days=MAX_INCUBATION_DAYS):
+    median = np.sqrt(q1 * q3)
+    sigma = np.log(q3 / q1) / (2 * norm.ppf(0.75))
+    edges = np.concatenate([[0], np.arange(max_days + 1) + 0.5])
+    pmf = np.diff(lognorm.cdf(edges, sigma, scale=median))
+    return pmf / pmf.sum()
+
+# expected onset counts from exposure curves (..., n_onset_days + len(pmf) - 1)
+def onsets_from_exposures(exposures, pmf):
+    kernel = pmf.reshape((1,) * (exposures.ndim - 1) + pmf.shape)
+    return np.clip(fftconvolve(exposures, kernel, mode='valid', axes=-1), 0, None)
+
+# Richardson-Lucy deconvolution of onset counts (..., n_days), vectorised over all leading axes; exposure days with a
+# sensitivity below min_sensitivity stay at zero and are flagged False in estimable
+def back_project(onsets, pmf, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE, min_sensitivity=MIN_SENSITIVITY):
+    onsets = np.asarray(onsets, dtype=float)
+    kernel = pmf[::-1].reshape((1,) * (onsets.ndim - 1) + pmf.shape)
+
+    # share of each exposure day's cases whose onset falls inside the observed onset days
+    sensitivity = fftconvolve(np.ones(onsets.shape[-1]), pmf[::-1], mode='full')
+    estimable = sensitivity >= min_sensitivity
+    sensitivity = np.where(estimable, sensitivity, 1.0)
+
+    # flat start on the estimable days, scaled so the expected onsets add up to the observed total
+    exposures = np.where(estimable, onsets.sum(axis=-1, keepdims=True) / sensitivity[estimable].sum(), 0.0)
+    iterations = 0
+    change = np.inf
+    while iterations < max_iterations and change >= tolerance:
+        expected = onsets_from_exposures(exposures, pmf)
+        ratio = np.divide(onsets, expected, out=np.zeros_like(onsets), where=expected > 0)
+        updated = exposures * np.clip(fftconvolve(ratio, kernel, mode='full', axes=-1), 0, None) / sensitivity
+        updated = np.where(estimable, updated, 0.0)
+        change = np.max(np.abs(updated - exposures)) / max(np.max(exposures), 1e-12)
+        exposures = updated
+        iterations += 1
+
+    if change >= tolerance:
+        print(f"Warning: back projection stopped after {iterations} iterations without converging "
+              f"(largest relative change {change:.2g}, tolerance {tolerance:g})")
+    return exposures, iterations, estimable
+
+# observed exposure curves and bootstrap intervals from Poisson resampled onset counts, all deconvolved in one batch
+def bootstrap_back_projection(daily, pmf, n_bootstrap=N_BOOTSTRAP, ci_level=CI_LEVEL, seed=BOOTSTRAP_SEED):
+    onsets = daily.T.astype(float)[None]
+    if n_bootstrap > 0:
+        rng = np.random.default_rng(seed)
+        onsets = np.concatenate([onsets, rng.poisson(onsets[0], size=(n_bootstrap,) + onsets.shape[1:])])
+    exposures, iterations, estimable = back_project(onsets, pmf)
+
+    tail = (1 - ci_level) / 2
+    lower = np.quantile(exposures[1:], tail, axis=0) if n_bootstrap > 0 else np.full(exposures.shape[1:], np.nan)
+    upper = np.quantile(exposures[1:], 1 - tail, axis=0) if n_bootstrap > 0 else np.full(exposures.shape[1:], np.nan)
+    return exposures[0], lower, upper, iterations, estimable
+
+def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, output_file, store_root=None, run=None, region=None):
+    treatment_coords = pd.read_csv(treatment_sites_file)[['lat', 'lon']].to_numpy()
+    control_coords = pd.read_csv(control_sites_file)[['lat', 'lon']].to_numpy()
+
+    times, counts = aggregate_case_counts(cases_file, treatment_coords, control_coords, start_unix, end_unix)
+    daily = daily_counts(times, counts, start_unix, (end_unix - start_unix) // DAY_SECONDS + 1)
+    pmf = incubation_pmf()
+    exposures, lower, upper, iterations, estimable = bootstrap_back_projection(daily, pmf)
+
+    # exposure days run from MAX_INCUBATION_DAYS before the first onset day to the last onset day; only the (contiguous)
+    # estimable days are reported
+    first_onset_day = local_datetimes(start_unix).normalize()
+    dates = pd.date_range(first_onset_day - pd.Timedelta(days=len(pmf) - 1), periods=exposures.shape[-1], freq='D')
+    dates, exposures, lower, upper = dates[estimable], exposures[:, estimable], lower[:, estimable], upper[:, estimable]
+
+    # the exposures should account for the observed onsets (plus those expected after the last onset day)
+    total_onsets = daily.sum()
+    total_exposures = exposures.sum()
+    if abs(total_exposures - total_onsets) > TOTAL_TOLERANCE * total_onsets:
+        print(f"Warning: back-projected total {total_exposures:.1f} differs from the {total_onsets} observed onsets "
+              f"by more than {TOTAL_TOLERANCE:.0%}")
+
+    curves = pd.DataFrame({'Date': dates.strftime('%d/%m/%Y')})
+    for i, cell in enumerate(CELLS):
+        curves[f'exposure_{cell}'] = exposures[i]
+        curves[f'exposure_{cell}_LCI'] = lower[i]
+        curves[f'exposure_{cell}_UCI'] = upper[i]
+    curves.to_csv(output_file, index=False)
+    print(f"Back-projected {total_onsets} onsets to {total_exposures:.1f} exposures over {len(curves)} exposure days "
+          f"in {iterations} iterations -> {output_file}")
+
+    # sliding windows over exposure dates, stored in the chunked_aggregation_v1.py window layout
+    if store_root is not None:
+        # expected exposures are summed per window before rounding to whole cases
+        first, expected_tables = daily_window_tables(exposures.T, WINDOW_DAYS, STEP_DAYS)
+        tables = np.rint(expected_tables).astype(np.int64)
+        stats = window_statistics(tables)
+        report = pd.DataFrame({
+            'START': local_dates_to_epoch(pd.Series(dates[first])),
+            'END': local_dates_to_epoch(pd.Series(dates[first] + pd.Timedelta(days=WINDOW_DAYS + 1))),
+            'PVAL': stats[:, 0],
+            'OR': stats[:, 1],
+            'CP': stats[:, 2],
+            'In treatment zone': tables[:, 0],
+            'Outside treatment zone': tables[:, 2],
+            'In control zone': tables[:, 1],
+            'Outside control zone': tables[:, 3],
+            'TOTAL': tables.sum(axis=1),
+        })
+        write_windows(report, store_root, run, region)
+        print(f"{len(report)} exposure date windows of {WINDOW_DAYS} days -> {store_root} (run={run}, region={region})")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (7, 10):
+        print("Usage: python back_projection_v1.py <cases_file> <treatment_sites_file> <control_sites_file> <start_unix> <end_unix> <output_file> [<store_root> <run> <region>]")
+        sys.exit(1)
+
+    cases_file = sys.argv[1]
+    treatment_sites_file = sys.argv[2]
+    control_sites_file = sys.argv[3]
+    start_unix = int(sys.argv[4])
+    end_unix = int(sys.argv[5])
+    output_file = sys.argv[6]
+    store_root, run, region = sys.argv[7:10] if len(sys.argv) == 10 else (None, None, None)
+
+    main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, output_file, store_root, run, region)
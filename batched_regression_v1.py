@@ -0,0 +1,163 @@
+import sys
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+from concurrent.futures import ProcessPoolExecutor
+
+# confidence level for the fit line bands
+CI_LEVEL = 0.95
+
+# number of bootstrap resamples of the slope (0 turns the bootstrap off)
+N_BOOTSTRAP = 0
+
+# number of series pairs handed to one bootstrap worker
+BOOTSTRAP_CHUNK_SIZE = 256
+
+# seed for the bootstrap resamples
+BOOTSTRAP_SEED = 1
+
+# largest number of resampled points (pairs x resamples x points) a worker holds at once, which bounds its memory
+BOOTSTRAP_BATCH_ELEMENTS = 2_000_000
+
+# stack a long table (series, imputed, observed) into NaN padded (pairs x points) arrays sorted by x
+def stack_pairs(df, series_col='series', x_col='imputed', y_col='observed'):
+    df = df[[series_col, x_col, y_col]].copy()
+    df[x_col] = pd.to_numeric(df[x_col], errors='coerce')
+    df[y_col] = pd.to_numeric(df[y_col], errors='coerce')
+    df = df.dropna().sort_values([series_col, x_col])
+    df['point'] = df.groupby(series_col).cumcount()
+
+    x = df.pivot(index=series_col, columns='point', values=x_col)
+    y = df.pivot(index=series_col, columns='point', values=y_col)
+    return x.index.to_numpy(), x.to_numpy(dtype='float64'), y.to_numpy(dtype='float64')
+
+# closed-form least squares for every row of x and y at once (NaN marks padding)
+def batched_linregress(x, y):
+    mask = ~(np.isnan(x) | np.isnan(y))
+    n = mask.sum(axis=1)
+    x0 = np.where(mask, x, 0.0)
+    y0 = np.where(mask, y, 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = x0.sum(axis=1) / n
+        mean_y = y0.sum(axis=1) / n
+        dx = np.where(mask, x0 - mean_x[:, None], 0.0)
+        dy = np.where(mask, y0 - mean_y[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        syy = (dy * dy).sum(axis=1)
+        sxy = (dx * dy).sum(axis=1)
+
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        r_value = np.clip(sxy / np.sqrt(sxx * syy), -1.0, 1.0)
+
+        # same t statistic and standard error as scipy.stats.linregress
+        dof = n - 2
+        t_stat = r_value * np.sqrt(dof / ((1.0 - r_value) * (1.0 + r_value)))
+        p_value = 2 * stats.t.sf(np.abs(t_stat), dof)
+        std_err = np.sqrt((1 - r_value ** 2) * syy / sxx / dof)
+
+        # residual standard error for the CI bands
+        residual_se = np.sqrt(np.maximum(syy - slope * sxy, 0.0) / dof)
+
+    return {
+        'n': n,
+        'slope': slope,
+        'intercept': intercept,
+        'r_squared': r_value ** 2,
+        'p_value': p_value,
+        'std_err': std_err,
+        'mean_x': mean_x,
+        'sxx': sxx,
+        'residual_se': residual_se,
+    }
+
+# fitted line and CI half widths for every point of every pair
+def ci_bands(x, fit, level=CI_LEVEL):
+    n = fit['n']
+    t_val = stats.t.ppf(0.5 + level / 2, df=n - 2)
+    predicted = fit['slope'][:, None] * x + fit['intercept'][:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        half_width = (t_val * fit['residual_se'])[:, None] * np.sqrt(
+            1 / n[:, None] + (x - fit['mean_x'][:, None]) ** 2 / fit['sxx'][:, None])
+    return predicted, predicted - half_width, predicted + half_width
+
+# bootstrap the slope of a chunk of pairs (rows are already NaN padded at the end)
+def bootstrap_slope_chunk(args):
+    x, y, n_bootstrap, seed = args
+    rng = np.random.default_rng(seed)
+    n = (~(np.isnan(x) | np.isnan(y))).sum(axis=1)
+    n_points = x.shape[1]
+
+    rows = np.arange(x.shape[0])[:, None, None]
+    pad = np.arange(n_points)[None, None, :] >= n[:, None, None]
+
+    # resamples are drawn in batches so the resampled arrays stay below BOOTSTRAP_BATCH_ELEMENTS
+    batch = max(1, BOOTSTRAP_BATCH_ELEMENTS // max(x.shape[0] * n_points, 1))
+    slopes = np.empty((x.shape[0], n_bootstrap))
+    for start in range(0, n_bootstrap, batch):
+        n_batch = min(batch, n_bootstrap - start)
+        # resample positions 0..n-1 of each row, padding positions beyond n with NaN
+        idx = np.floor(rng.random((x.shape[0], n_batch, n_points)) * n[:, None, None]).astype(int)
+        idx = np.minimum(idx, n_points - 1)
+        bx = np.where(pad, np.nan, x[rows, idx])
+        by = np.where(pad, np.nan, y[rows, idx])
+        fit = batched_linregress(bx.reshape(-1, n_points), by.reshape(-1, n_points))
+        slopes[:, start:start + n_batch] = fit['slope'].reshape(x.shape[0], n_batch)
+    return np.nanpercentile(slopes, [100 * (1 - CI_LEVEL) / 2, 100 * (1 + CI_LEVEL) / 2], axis=1).T
+
+# percentile CI of the slope for every pair, with chunks of pairs spread over worker processes
+def bootstrap_slope(x, y, n_bootstrap, chunk_size=BOOTSTRAP_CHUNK_SIZE, seed=BOOTSTRAP_SEED, max_workers=None):
+    starts = range(0, x.shape[0], chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    jobs = [(x[i:i + chunk_size], y[i:i + chunk_size], n_bootstrap, s) for i, s in zip(starts, seeds)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return np.vstack(list(pool.map(bootstrap_slope_chunk, jobs)))
+
+def main(pairs_file, output_file, bands_file=None, n_bootstrap=N_BOOTSTRAP):
+    series, x, y = stack_pairs(pd.read_csv(pairs_file, encoding='utf-8-sig'))
+    fit = batched_linregress(x, y)
+
+    results = pd.DataFrame({
+        'series': series,
+        'n': fit['n'],
+        'slope': fit['slope'],
+        'intercept': fit['intercept'],
+        'r_squared': fit['r_squared'],
+        'p_value': fit['p_value'],
+        'std_err': fit['std_err'],
+    })
+
+    if n_bootstrap > 0:
+        slope_ci = bootstrap_slope(x, y, n_bootstrap)
+        results['slope_ci_lower'] = slope_ci[:, 0]
+        results['slope_ci_upper'] = slope_ci[:, 1]
+
+    results.to_csv(output_file, index=False)
+    print(f"Fitted {len(results)} series pairs -> {output_file}")
+
+    # write the fitted line and 95% CI band in long format
+    if bands_file is not None:
+        predicted, lower, upper = ci_bands(x, fit)
+        keep = ~np.isnan(x)
+        bands = pd.DataFrame({
+            'series': np.repeat(series, x.shape[1])[keep.ravel()],
+            'x': x[keep],
+            'fit': predicted[keep],
+            'ci_lower': lower[keep],
+            'ci_upper': upper[keep],
+        })
+        bands.to_csv(bands_file, index=False)
+        print(f"CI bands -> {bands_file}")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4, 5):
+        print("Usage: python batched_regression_v1.py <pairs_file> <output_file> [bands_file] [n_bootstrap]")
+        sys.exit(1)
+
+    pairs_file = sys.argv[1]
+    output_file = sys.argv[2]
+    bands_file = sys.argv[3] if len(sys.argv) >= 4 else None
+    n_bootstrap = int(sys.argv[4]) if len(sys.argv) == 5 else N_BOOTSTRAP
+
+    main(pairs_file, output_file, bands_file, n_bootstrap)
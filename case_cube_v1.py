@@ -0,0 +1,99 @@
+import sys
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# meshblock identifier column of the ABS shapefile (the row position is used if it is missing)
+MESHBLOCK_ID_COLUMN = 'MB_CODE11'
+
+# assign every case to its meshblock with one spatial join (-1 for cases outside all meshblocks)
+def assign_meshblocks(cases, meshblocks):
+    import geopandas as gpd
+    from shapely.geometry import Point
+
+    geometry = [Point(xy) for xy in zip(cases['lon'], cases['lat'])]
+    cases_gdf = gpd.GeoDataFrame(cases[['unix_time']].copy(), geometry=geometry, crs="EPSG:4326")
+    if meshblocks.crs != cases_gdf.crs:
+        cases_gdf = cases_gdf.to_crs(meshblocks.crs)
+
+    positions = pd.Series(np.arange(len(meshblocks)), index=meshblocks.index)
+    joined = gpd.sjoin(cases_gdf, meshblocks[['geometry']], how='left', predicate='within')
+    # a case on a shared edge can match twice; keep its first meshblock
+    joined = joined[~joined.index.duplicated(keep='first')].sort_index()
+    return positions.reindex(joined['index_right']).fillna(-1).astype(int).to_numpy()
+
+# sparse (meshblocks x distinct case times + 1) cumulative count matrix with a leading zero column, stored column-wise,
+# and the sorted distinct case times of its columns
+def build_case_cube(meshblock_rows, case_times, n_meshblocks):
+    keep = meshblock_rows >= 0
+    times, time_columns = np.unique(np.asarray(case_times)[keep], return_inverse=True)
+    counts = sp.coo_matrix((np.ones(keep.sum()), (meshblock_rows[keep], time_columns)),
+                           shape=(n_meshblocks, len(times))).tocsr()
+
+    # cumulative sums are only formed for meshblocks that have cases
+    occupied = np.flatnonzero(counts.getnnz(axis=1))
+    cumulative = np.cumsum(counts[occupied].toarray(), axis=1)
+    cumulative = np.hstack([np.zeros((len(occupied), 1)), cumulative])
+    cum_occupied = sp.csr_matrix(cumulative)
+    expand = sp.csr_matrix((np.ones(len(occupied)), (occupied, np.arange(len(occupied)))),
+                           shape=(n_meshblocks, len(occupied)))
+    return (expand @ cum_occupied).tocsc(), times
+
+def save_case_cube(output_file, cumulative, meshblock_ids, times):
+    np.savez_compressed(output_file, data=cumulative.data, indices=cumulative.indices, indptr=cumulative.indptr,
+                        shape=np.asarray(cumulative.shape), meshblock_ids=np.asarray(meshblock_ids, dtype=str),
+                        times=np.asarray(times, dtype=np.int64))
+
+def load_case_cube(cube_file):
+    with np.load(cube_file) as stored:
+        cumulative = sp.csc_matrix((stored['data'], stored['indices'], stored['indptr']), shape=tuple(stored['shape']))
+        return {
+            'cumulative': cumulative,
+            'meshblock_ids': stored['meshblock_ids'],
+            'times': stored['times'],
+        }
+
+# columns of the cumulative matrix bounding the cases with START <= unix_time <= END (as in FET_v4.py) for every window
+def window_columns(cube, starts, ends):
+    first = np.searchsorted(cube['times'], np.asarray(starts), side='left')
+    last = np.searchsorted(cube['times'], np.asarray(ends), side='right')
+    return first, last
+
+# case counts per meshblock (rows) for every window (columns) from one sparse slice, optionally for a subset of meshblocks
+def window_counts(cube, starts, ends, meshblock_rows=None):
+    cumulative = cube['cumulative']
+    if meshblock_rows is not None:
+        cumulative = cumulative.tocsr()[meshblock_rows].tocsc()
+    first, last = window_columns(cube, np.atleast_1d(starts), np.atleast_1d(ends))
+    return (cumulative[:, last] - cumulative[:, first]).tocsc()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 6:
+        print("Usage: python case_cube_v1.py <meshblock_shp> <cases_file> <start_unix> <end_unix> <output_npz>")
+        sys.exit(1)
+
+    import geopandas as gpd
+
+    meshblock_shp_path = sys.argv[1]
+    cases_file = sys.argv[2]
+    start_unix = int(sys.argv[3])
+    end_unix = int(sys.argv[4])
+    output_file = sys.argv[5]
+
+    meshblocks = gpd.read_file(meshblock_shp_path)
+    cases = pd.read_csv(cases_file)
+    cases['unix_time'] = pd.to_numeric(cases['unix_time'], errors='coerce')
+    cases = cases.dropna(subset=['unix_time', 'lat', 'lon'])
+    cases = cases[(cases['unix_time'] >= start_unix) & (cases['unix_time'] <= end_unix)].reset_index(drop=True)
+
+    meshblock_rows = assign_meshblocks(cases, meshblocks)
+
+    if MESHBLOCK_ID_COLUMN in meshblocks.columns:
+        meshblock_ids = meshblocks[MESHBLOCK_ID_COLUMN].astype(str).to_numpy()
+    else:
+        meshblock_ids = np.arange(len(meshblocks)).astype(str)
+
+    cumulative, times = build_case_cube(meshblock_rows, cases['unix_time'].to_numpy().astype(np.int64), len(meshblocks))
+    save_case_cube(output_file, cumulative, meshblock_ids, times)
+    print(f"{np.sum(meshblock_rows >= 0)} of {len(cases)} cases in {cumulative.getnnz(axis=1).astype(bool).sum()} meshblocks "
+          f"at {len(times)} distinct case times -> {output_file}")
@@ -0,0 +1,119 @@
+import sys
+import zipfile
+import numpy as np
+import pandas as pd
+from scipy.signal import fftconvolve
+from FET_v4 import raster_shape, sliding_windows
+
+# mapping area of Fig. 1B (min_lon, max_lon, min_lat, max_lat)
+DENSITY_BBOX = (144.86, 144.986887, -37.785, -37.714593)
+
+# raster cell size (m)
+DENSITY_CELL_M = 25
+
+# standard deviation of the Gaussian smoothing kernel (m)
+DENSITY_BANDWIDTH_M = 200
+
+# the kernel is cut off at this many standard deviations
+KERNEL_TRUNCATE = 3
+
+# window frames binned and smoothed together (the float32 stack of one chunk is all that is held in memory)
+FRAME_CHUNK = 16
+
+# count cases per raster cell (rows run south to north); cases outside the bbox are dropped
+def bin_cases(lat, lon, bbox=DENSITY_BBOX, cell_m=DENSITY_CELL_M):
+    min_lon, max_lon, min_lat, max_lat = bbox
+    ny, nx, cell_lat, cell_lon = raster_shape(bbox, cell_m)
+    col = np.floor((np.asarray(lon) - min_lon) / cell_lon).astype(int)
+    row = np.floor((np.asarray(lat) - min_lat) / cell_lat).astype(int)
+    keep = (col >= 0) & (col < nx) & (row >= 0) & (row < ny)
+    return np.bincount(row[keep] * nx + col[keep], minlength=ny * nx).reshape(ny, nx).astype(float)
+
+# normalised 2D Gaussian kernel on the raster grid
+def gaussian_kernel(bandwidth_m=DENSITY_BANDWIDTH_M, cell_m=DENSITY_CELL_M):
+    half = int(np.ceil(KERNEL_TRUNCATE * bandwidth_m / cell_m))
+    offsets = np.arange(-half, half + 1) * cell_m
+    kernel_1d = np.exp(-0.5 * (offsets / bandwidth_m) ** 2)
+    kernel = np.outer(kernel_1d, kernel_1d)
+    return kernel / kernel.sum()
+
+# smooth one raster (ny, nx) or a stack of frames (frames, ny, nx) by FFT convolution; returns cases per km² in the
+# precision of counts
+def smooth_density(counts, bandwidth_m=DENSITY_BANDWIDTH_M, cell_m=DENSITY_CELL_M):
+    kernel = gaussian_kernel(bandwidth_m, cell_m).astype(counts.dtype)
+    if counts.ndim == 3:
+        density = fftconvolve(counts, kernel[None, :, :], mode='same', axes=(1, 2))
+    else:
+        density = fftconvolve(counts, kernel, mode='same')
+    # remove FFT round-off below zero
+    density = np.maximum(density, 0)
+    return density / counts.dtype.type((cell_m / 1000.0) ** 2)
+
+# density raster of every case in a data frame with lat/lon columns
+def case_density(cases, bbox=DENSITY_BBOX, cell_m=DENSITY_CELL_M, bandwidth_m=DENSITY_BANDWIDTH_M):
+    counts = bin_cases(cases['lat'].to_numpy(), cases['lon'].to_numpy(), bbox, cell_m)
+    return smooth_density(counts, bandwidth_m, cell_m)
+
+# yield one float32 density frame per (start, end) unix window; cases are sorted by time so each frame only touches its
+# own cases, and frames are smoothed chunk_frames at a time so memory does not grow with the number of windows
+def window_frames(cases, starts, ends, bbox=DENSITY_BBOX, cell_m=DENSITY_CELL_M, bandwidth_m=DENSITY_BANDWIDTH_M,
+                  chunk_frames=FRAME_CHUNK):
+    cases = cases.sort_values('unix_time')
+    times = cases['unix_time'].to_numpy()
+    lat = cases['lat'].to_numpy()
+    lon = cases['lon'].to_numpy()
+
+    ny, nx, _, _ = raster_shape(bbox, cell_m)
+    first = np.searchsorted(times, starts, side='left')
+    last = np.searchsorted(times, ends, side='right')
+    for chunk_start in range(0, len(first), chunk_frames):
+        chunk = range(chunk_start, min(chunk_start + chunk_frames, len(first)))
+        counts = np.zeros((len(chunk), ny, nx), dtype=np.float32)
+        for j, i in enumerate(chunk):
+            counts[j] = bin_cases(lat[first[i]:last[i]], lon[first[i]:last[i]], bbox, cell_m)
+        yield from smooth_density(counts, bandwidth_m, cell_m)
+
+# draw a density raster as a single image layer (cells below min_density are left transparent)
+def plot_density(ax, density, cmap, bbox=DENSITY_BBOX, cell_m=DENSITY_CELL_M, min_density=None, alpha=0.7, zorder=0.5):
+    min_lon, max_lon, min_lat, max_lat = bbox
+    ny, nx, cell_lat, cell_lon = raster_shape(bbox, cell_m)
+    if min_density is None:
+        min_density = 0.05 * density.max() if density.max() > 0 else 1.0
+    return ax.imshow(np.ma.masked_less(density, min_density), cmap=cmap, alpha=alpha, zorder=zorder,
+                     origin='lower', interpolation='bilinear', aspect='auto',
+                     extent=(min_lon, min_lon + nx * cell_lon, min_lat, min_lat + ny * cell_lat))
+
+def main(cases_file, start_unix, end_unix, window_days, step_days, output_file):
+    cases = pd.read_csv(cases_file)
+    cases['unix_time'] = pd.to_numeric(cases['unix_time'], errors='coerce')
+    cases = cases.dropna(subset=['unix_time', 'lat', 'lon'])
+
+    starts, ends = sliding_windows(start_unix, end_unix, window_days, step_days)
+    ny, nx, _, _ = raster_shape(DENSITY_BBOX, DENSITY_CELL_M)
+
+    # the frames array is streamed into the npz one frame at a time (np.load reads it as a (frames, ny, nx) array)
+    with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as npz:
+        with npz.open('frames.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array_header_2_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                                                     'fortran_order': False, 'shape': (len(starts), ny, nx)})
+            for frame in window_frames(cases, starts, ends):
+                f.write(frame.tobytes())
+        for name, value in (('START', starts), ('END', ends), ('bbox', np.asarray(DENSITY_BBOX)),
+                            ('cell_m', DENSITY_CELL_M), ('bandwidth_m', DENSITY_BANDWIDTH_M)):
+            with npz.open(f'{name}.npy', 'w') as f:
+                np.lib.format.write_array(f, np.asarray(value))
+    print(f"{len(starts)} density frames of {ny} x {nx} cells -> {output_file}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 7:
+        print("Usage: python case_density_raster_v1.py <cases_file> <start_unix> <end_unix> <window_days> <step_days> <output_npz>")
+        sys.exit(1)
+
+    cases_file = sys.argv[1]
+    start_unix = int(sys.argv[2])
+    end_unix = int(sys.argv[3])
+    window_days = int(sys.argv[4])
+    step_days = int(sys.argv[5])
+    output_file = sys.argv[6]
+
+    main(cases_file, start_unix, end_unix, window_days, step_days, output_file)
@@ -0,0 +1,145 @@
+import sys
+import numpy as np
+import pandas as pd
+from scipy.stats import fisher_exact
+from statsmodels.stats.contingency_tables import Table2x2
+from FET_v4 import DAY_SECONDS, WINDOW_DAYS, STEP_DAYS, classify_cases, sliding_windows
+from results_store_v1 import write_windows
+
+# rows of the cases file read per batch
+CHUNK_ROWS = 1_000_000
+
+# distance mode of the batches classified without a zone grid (FET_v4.py): spherical screening of every case-site pair,
+# geodesic only near the zone boundaries and nearest-site ties, so large batches are not classified pair by pair
+DISTANCE_MODE = 'hybrid'
+
+# per-time count columns, in the contingency table layout of FET_v4.py
+#         Inside Zone    Outside Zone
+# treatment   a                c
+# control     b                d
+CELLS = ['a', 'b', 'c', 'd']
+
+# add the a/b/c/d counts of (times, counts) into those of (all_times, all_counts), keyed by distinct unix time
+def merge_time_counts(all_times, all_counts, times, counts):
+    merged_times, inverse = np.unique(np.concatenate([all_times, times]), return_inverse=True)
+    merged_counts = np.zeros((len(merged_times), len(CELLS)), dtype=np.int64)
+    np.add.at(merged_counts, inverse, np.vstack([all_counts, counts]))
+    return merged_times, merged_counts
+
+# stream the cases file and fold every batch into a/b/c/d counts per distinct unix time (memory grows with the
+# number of distinct times, not cases), so windows can be cut exactly as FET_v4.py does
+def aggregate_case_counts(cases_file, treatment_coords, control_coords, start_unix, end_unix,
+                          zone_grid=None, chunk_rows=CHUNK_ROWS):
+    times = np.zeros(0, dtype=np.int64)
+    counts = np.zeros((0, len(CELLS)), dtype=np.int64)
+    n_read = 0
+    if zone_grid is not None:
+        from zone_lookup_grid_v1 import classify_with_grid
+
+    for chunk in pd.read_csv(cases_file, usecols=['unix_time', 'lat', 'lon'], chunksize=chunk_rows):
+        n_read += len(chunk)
+        chunk['unix_time'] = pd.to_numeric(chunk['unix_time'], errors='coerce')
+        chunk = chunk.dropna()
+        chunk = chunk[(chunk['unix_time'] >= start_unix) & (chunk['unix_time'] <= end_unix)]
+        if chunk.empty:
+            continue
+
+        case_coords = chunk[['lat', 'lon']].to_numpy()
+        if zone_grid is not None:
+            nearest_treatment, within_zone = classify_with_grid(zone_grid, case_coords, treatment_coords, control_coords)
+        else:
+            nearest_treatment, within_zone = classify_cases(case_coords, treatment_coords, control_coords, DISTANCE_MODE)
+
+        # cell index 0..3 = a, b, c, d
+        cell = np.where(within_zone, 0, 2) + np.where(nearest_treatment, 0, 1)
+        chunk_times, inverse = np.unique(chunk['unix_time'].to_numpy().astype(np.int64), return_inverse=True)
+        chunk_counts = np.bincount(inverse * len(CELLS) + cell, minlength=len(chunk_times) * len(CELLS))
+        times, counts = merge_time_counts(times, counts, chunk_times, chunk_counts.reshape(-1, len(CELLS)))
+
+    print(f"Aggregated {n_read} case rows into {len(times)} distinct case times")
+    return times, counts
+
+# a/b/c/d counts of the cases with START <= unix_time <= END for every window, from cumulative counts over the sorted times
+def window_tables(times, counts, starts, ends):
+    cumulative = np.vstack([np.zeros((1, counts.shape[1]), dtype=counts.dtype), np.cumsum(counts, axis=0)])
+    first = np.searchsorted(times, starts, side='left')
+    last = np.searchsorted(times, ends, side='right')
+    return cumulative[last] - cumulative[first]
+
+# counts per day for models that need a daily series: day k holds start_unix + k days <= unix_time < start_unix + k + 1 days,
+# so the window of FET_v4.sliding_windows starting on day k holds days k .. k + WINDOW_DAYS (and nothing at its END second
+# unless a case time falls exactly on it)
+def daily_counts(times, counts, start_unix, n_days):
+    day = np.floor((np.asarray(times) - start_unix) / DAY_SECONDS).astype(int)
+    keep = (day >= 0) & (day < n_days)
+    daily = np.zeros((n_days, counts.shape[1]), dtype=counts.dtype)
+    np.add.at(daily, day[keep], counts[keep])
+    return daily
+
+# counts of every sliding window of a daily series (days along the last-but-one axis), as daily_counts lines windows up
+def daily_window_tables(daily, window_days=WINDOW_DAYS, step_days=STEP_DAYS):
+    n_days = daily.shape[-2]
+    zeros = np.zeros(daily.shape[:-2] + (1,) + daily.shape[-1:], dtype=daily.dtype)
+    cumulative = np.concatenate([zeros, np.cumsum(daily, axis=-2)], axis=-2)
+    first = np.arange(0, n_days - window_days, step_days)
+    return first, cumulative[..., first + window_days + 1, :] - cumulative[..., first, :]
+
+# p-value, odds ratio and cases prevented for every window, computed once per distinct table
+def window_statistics(tables):
+    unique_tables, inverse = np.unique(tables, axis=0, return_inverse=True)
+    stats = np.full((len(unique_tables), 3), np.nan)
+    for i, (a, b, c, d) in enumerate(unique_tables):
+        contingency_table = np.array([[a, b], [c, d]])
+        if np.any(contingency_table.sum(axis=0) == 0) or np.any(contingency_table.sum(axis=1) == 0):
+            continue
+        p_value = fisher_exact(contingency_table)[1]
+        odds_ratio = Table2x2(contingency_table).oddsratio
+        cases_prevented = (b / (b + d)) * (a + c) - a
+        stats[i] = p_value, odds_ratio, cases_prevented
+    return stats[inverse.ravel()]
+
+def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, store_root, run, region, zone_grid_file=None):
+    treatment_coords = pd.read_csv(treatment_sites_file)[['lat', 'lon']].to_numpy()
+    control_coords = pd.read_csv(control_sites_file)[['lat', 'lon']].to_numpy()
+
+    zone_grid = None
+    if zone_grid_file is not None:
+        from zone_lookup_grid_v1 import load_zone_grid
+        zone_grid = load_zone_grid(zone_grid_file, treatment_coords, control_coords)
+
+    times, counts = aggregate_case_counts(cases_file, treatment_coords, control_coords, start_unix, end_unix, zone_grid)
+    starts, ends = sliding_windows(start_unix, end_unix)
+    tables = window_tables(times, counts, starts, ends)
+    stats = window_statistics(tables)
+
+    report = pd.DataFrame({
+        'START': starts,
+        'END': ends,
+        'PVAL': stats[:, 0],
+        'OR': stats[:, 1],
+        'CP': stats[:, 2],
+        'In treatment zone': tables[:, 0],
+        'Outside treatment zone': tables[:, 2],
+        'In control zone': tables[:, 1],
+        'Outside control zone': tables[:, 3],
+        'TOTAL': tables.sum(axis=1),
+    })
+    write_windows(report, store_root, run, region)
+    print(f"{len(report)} windows of {WINDOW_DAYS} days -> {store_root} (run={run}, region={region})")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (9, 10):
+        print("Usage: python chunked_aggregation_v1.py <cases_file> <treatment_sites_file> <control_sites_file> <start_unix> <end_unix> <store_root> <run> <region> [zone_grid_file]")
+        sys.exit(1)
+
+    cases_file = sys.argv[1]
+    treatment_sites_file = sys.argv[2]
+    control_sites_file = sys.argv[3]
+    start_unix = int(sys.argv[4])
+    end_unix = int(sys.argv[5])
+    store_root = sys.argv[6]
+    run = sys.argv[7]
+    region = sys.argv[8]
+    zone_grid_file = sys.argv[9] if len(sys.argv) == 10 else None
+
+    main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, store_root, run, region, zone_grid_file)
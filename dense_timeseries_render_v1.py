@@ -0,0 +1,56 @@
+import numpy as np
+from matplotlib.colors import to_rgb
+
+# number of series (rows of series) crossing every pixel of an n_rows x n_columns grid over xlim x ylim; each series
+# covers, per pixel column, the rows between its values at the column edges, widened to the line width
+def line_pixel_counts(x, series, xlim, ylim, n_columns, n_rows, width_px=1.0):
+    x = np.asarray(x, dtype=float)
+    series = np.atleast_2d(np.asarray(series, dtype=float))
+
+    # linear interpolation of every series at the column edges (NaN outside the data and across NaN gaps)
+    edges = np.linspace(xlim[0], xlim[1], n_columns + 1)
+    j = np.clip(np.searchsorted(x, edges, side='right') - 1, 0, x.size - 2)
+    w = (edges - x[j]) / (x[j + 1] - x[j])
+    y = series[:, j] * (1 - w) + series[:, j + 1] * w
+    y[:, (edges < x[0]) | (edges > x[-1])] = np.nan
+
+    rows_per_unit = n_rows / (ylim[1] - ylim[0])
+    lo = (np.fmin(y[:, :-1], y[:, 1:]) - ylim[0]) * rows_per_unit - width_px / 2
+    hi = (np.fmax(y[:, :-1], y[:, 1:]) - ylim[0]) * rows_per_unit + width_px / 2
+    valid = ~np.isnan(lo) & (hi >= 0) & (lo < n_rows)
+    column = np.broadcast_to(np.arange(n_columns), lo.shape)[valid]
+    lo = np.clip(np.floor(lo[valid]), 0, n_rows - 1).astype(np.int64)
+    hi = np.clip(np.floor(hi[valid]), 0, n_rows - 1).astype(np.int64)
+
+    # +1 at the first and -1 after the last covered row of every (series, column), summed up the rows
+    diff = np.bincount(lo * n_columns + column, minlength=(n_rows + 1) * n_columns)
+    diff -= np.bincount((hi + 1) * n_columns + column, minlength=(n_rows + 1) * n_columns)
+    return np.cumsum(diff.reshape(n_rows + 1, n_columns), axis=0)[:n_rows]
+
+# draw a family of series (series x points) as one image over the current axes limits, at raster_dpi pixels per inch;
+# overlapping lines combine as alpha-blended lines of one colour would (1 - (1 - alpha)^count)
+def add_replicate_lines(ax, x, series, color, linewidth, alpha, raster_dpi=None, zorder=0, label=None):
+    fig = ax.figure
+    raster_dpi = raster_dpi if raster_dpi is not None else fig.get_dpi()
+    scale = raster_dpi / fig.get_dpi()
+    n_columns = max(1, int(round(ax.bbox.width * scale)))
+    n_rows = max(1, int(round(ax.bbox.height * scale)))
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+
+    counts = line_pixel_counts(x, series, xlim, ylim, n_columns, n_rows, linewidth / 72 * raster_dpi)
+    rgba = np.zeros((n_rows, n_columns, 4))
+    rgba[..., :3] = to_rgb(color)
+    rgba[..., 3] = 1 - (1 - alpha) ** counts
+    image = ax.imshow(rgba, origin='lower', extent=(xlim[0], xlim[1], ylim[0], ylim[1]), aspect='auto',
+                      interpolation='antialiased', zorder=zorder, label=label)
+    image.set_rasterized(True)
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    return image
+
+# save the figure in every format: rasterised layers of vector formats are rendered at raster_dpi, and raster formats
+# (png) at png_dpi; None keeps the figure's own dpi, as plain savefig does
+def save_formats(fig, basename, formats=('svg', 'png'), raster_dpi=None, png_dpi=None):
+    for fmt in formats:
+        dpi = png_dpi if fmt == 'png' else raster_dpi
+        fig.savefig(f'{basename}.{fmt}', format=fmt, dpi=dpi if dpi is not None else 'figure')
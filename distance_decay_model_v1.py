@@ -0,0 +1,130 @@
+import sys
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from scipy.stats import norm
+from scipy.special import expit
+from FET_v4 import METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON, classify_cases, sliding_windows
+from results_store_v1 import write_windows
+
+# Gaussian distance-decay kernel scale (km); exposure to a site is exp(-0.5 * (d / scale)^2)
+KERNEL_SCALE_KM = 0.4
+
+# site pairs further apart than this (km) contribute no exposure and are never stored
+EXPOSURE_CUTOFF_KM = 1.6
+
+# Newton-Raphson settings for the per-window logistic fits
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-8
+
+# local equirectangular coordinates (km) around a reference latitude
+def to_local_km(coords, lat_ref):
+    coords = np.asarray(coords, dtype=float)
+    x = coords[:, 1] * METERS_PER_DEGREE_LON * np.cos(np.radians(lat_ref)) / 1000
+    y = coords[:, 0] * METERS_PER_DEGREE_LAT / 1000
+    return np.column_stack([x, y])
+
+# kernel exposure of every case to a set of sites, from a sparse list of case-site pairs within the cutoff
+def site_exposure(case_xy, site_xy, scale_km=KERNEL_SCALE_KM, cutoff_km=EXPOSURE_CUTOFF_KM):
+    pairs = cKDTree(case_xy).sparse_distance_matrix(cKDTree(site_xy), cutoff_km, output_type='coo_matrix')
+    weights = np.exp(-0.5 * (pairs.data / scale_km) ** 2)
+    return np.bincount(pairs.row, weights=weights, minlength=len(case_xy))
+
+# logistic regression of y on x (with intercept) by Newton-Raphson, starting from beta
+def fit_logistic(x, y, beta):
+    design = np.column_stack([np.ones_like(x), x])
+    for iteration in range(MAX_ITERATIONS):
+        p = expit(design @ beta)
+        w = p * (1 - p)
+        information = design.T @ (design * w[:, None])
+        try:
+            step = np.linalg.solve(information, design.T @ (y - p))
+        except np.linalg.LinAlgError:
+            return beta, None, False, iteration
+        beta = beta + step
+        if np.max(np.abs(step)) < TOLERANCE:
+            p = expit(design @ beta)
+            information = design.T @ (design * (p * (1 - p))[:, None])
+            try:
+                return beta, np.linalg.inv(information), True, iteration + 1
+            except np.linalg.LinAlgError:
+                return beta, None, False, iteration + 1
+    return beta, None, False, MAX_ITERATIONS
+
+# fit every sliding window in time order, warm-starting each fit from the previous window's estimate
+def sweep_windows(times, exposure, treatment_arm, starts, ends):
+    order = np.argsort(times, kind='stable')
+    times, exposure, treatment_arm = times[order], exposure[order], treatment_arm[order]
+    first = np.searchsorted(times, starts, side='left')
+    last = np.searchsorted(times, ends, side='right')
+
+    rows = []
+    beta = np.zeros(2)
+    for lo, hi in zip(first, last):
+        x = exposure[lo:hi]
+        y = treatment_arm[lo:hi].astype(float)
+        result = {'n': hi - lo, 'beta0': np.nan, 'beta1': np.nan, 'se_beta1': np.nan,
+                  'OR_per_unit_exposure': np.nan, 'PVAL': np.nan, 'iterations': 0}
+
+        # both arms and some spread of exposure are needed for a fit
+        if hi - lo >= 3 and 0 < y.sum() < len(y) and np.ptp(x) > 0:
+            fitted, covariance, converged, iterations = fit_logistic(x, y, beta)
+            result['iterations'] = iterations
+            if converged and covariance[1, 1] > 0:
+                beta = fitted
+                se = np.sqrt(covariance[1, 1])
+                result.update(beta0=fitted[0], beta1=fitted[1], se_beta1=se,
+                              OR_per_unit_exposure=np.exp(fitted[1]),
+                              PVAL=2 * norm.sf(abs(fitted[1] / se)))
+            else:
+                # a separated or singular window should not poison the next start
+                beta = np.zeros(2)
+        rows.append(result)
+    return pd.DataFrame(rows)
+
+def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, store_root, run, region):
+    cases = pd.read_csv(cases_file)
+    treatment_coords = pd.read_csv(treatment_sites_file)[['lat', 'lon']].to_numpy()
+    control_coords = pd.read_csv(control_sites_file)[['lat', 'lon']].to_numpy()
+
+    cases['unix_time'] = pd.to_numeric(cases['unix_time'], errors='coerce')
+    cases = cases.dropna(subset=['unix_time', 'lat', 'lon'])
+    cases = cases[(cases['unix_time'] >= start_unix) & (cases['unix_time'] <= end_unix)]
+
+    if cases.empty:
+        print("No cases found in the specified time window.")
+        return
+
+    case_coords = cases[['lat', 'lon']].to_numpy()
+    lat_ref = np.mean(np.vstack([treatment_coords, control_coords])[:, 0])
+    case_xy = to_local_km(case_coords, lat_ref)
+    treatment_exposure = site_exposure(case_xy, to_local_km(treatment_coords, lat_ref))
+    control_exposure = site_exposure(case_xy, to_local_km(control_coords, lat_ref))
+
+    # arm membership as in the Fisher's exact test; each case is exposed to the sites of its own arm
+    treatment_arm, _ = classify_cases(case_coords, treatment_coords, control_coords)
+    exposure = np.where(treatment_arm, treatment_exposure, control_exposure)
+
+    starts, ends = sliding_windows(start_unix, end_unix)
+    fits = sweep_windows(cases['unix_time'].to_numpy(), exposure, treatment_arm, starts, ends)
+
+    fits.insert(0, 'START', starts)
+    fits.insert(1, 'END', ends)
+    write_windows(fits, store_root, run, region)
+    print(f"Fitted {fits['beta1'].notna().sum()} of {len(fits)} windows -> {store_root} (run={run}, region={region})")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 9:
+        print("Usage: python distance_decay_model_v1.py <cases_file> <treatment_sites_file> <control_sites_file> <start_unix> <end_unix> <store_root> <run> <region>")
+        sys.exit(1)
+
+    cases_file = sys.argv[1]
+    treatment_sites_file = sys.argv[2]
+    control_sites_file = sys.argv[3]
+    start_unix = int(sys.argv[4])
+    end_unix = int(sys.argv[5])
+    store_root = sys.argv[6]
+    run = sys.argv[7]
+    region = sys.argv[8]
+
+    main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, store_root, run, region)
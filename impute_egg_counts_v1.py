@@ -0,0 +1,143 @@
+import os
+import sys
+import glob
+import numpy as np
+import pandas as pd
+from FET_v4 import DAY_SECONDS, local_datetimes
+
+# number of trap files interpolated together as one 2D array
+TRAP_BATCH_SIZE = 64
+
+# longest gap (in days) between two ovitrap readings that is still interpolated across
+MAX_GAP_DAYS = 14
+
+# trap files are named by arm, the same way as the KML overlays (e.g. Treatment_1.csv, Control_3.csv)
+ARMS = ['Treatment', 'Control']
+
+# output date format (matches FULL_impute_FET_CP_and_egg_count_NAs_egg-diff_v2.csv)
+OUTPUT_DATE_FORMAT = '%d.%m.%Y'
+
+# get the arm of a trap from its file name
+def trap_arm(trap_file):
+    name = os.path.basename(trap_file)
+    for arm in ARMS:
+        if name.startswith(arm):
+            return arm
+    return None
+
+# read one trap file and snap its readings onto the daily grid (mean of readings on the same day)
+def read_trap(trap_file, grid_start_unix, n_days):
+    trap = pd.read_csv(trap_file)
+    trap['unix_time'] = pd.to_numeric(trap['unix_time'], errors='coerce')
+    trap['egg_count'] = pd.to_numeric(trap['egg_count'], errors='coerce')
+    trap = trap.dropna(subset=['unix_time', 'egg_count'])
+
+    # round rather than floor so daylight saving shifts of local midnight stay on the same day
+    day_index = np.rint((trap['unix_time'].to_numpy() - grid_start_unix) / DAY_SECONDS).astype(int)
+    keep = (day_index >= 0) & (day_index < n_days)
+    day_index = day_index[keep]
+    counts = trap['egg_count'].to_numpy(dtype=float)[keep]
+
+    sums = np.bincount(day_index, weights=counts, minlength=n_days)
+    readings = np.bincount(day_index, minlength=n_days)
+    row = np.full(n_days, np.nan)
+    row[readings > 0] = sums[readings > 0] / readings[readings > 0]
+    return row
+
+# linearly interpolate every row of a (traps x days) array between its non-NA readings
+def interpolate_rows(values, max_gap_days=MAX_GAP_DAYS):
+    n_traps, n_days = values.shape
+    days = np.arange(n_days)
+    observed = ~np.isnan(values)
+
+    # index of the previous and next reading for every cell
+    prev_idx = np.maximum.accumulate(np.where(observed, days, -1), axis=1)
+    next_idx = np.minimum.accumulate(np.where(observed, days, n_days)[:, ::-1], axis=1)[:, ::-1]
+
+    valid = (prev_idx >= 0) & (next_idx < n_days) & (next_idx - prev_idx <= max_gap_days)
+    prev_safe = np.clip(prev_idx, 0, n_days - 1)
+    next_safe = np.clip(next_idx, 0, n_days - 1)
+    prev_val = np.take_along_axis(values, prev_safe, axis=1)
+    next_val = np.take_along_axis(values, next_safe, axis=1)
+
+    # weight of the next reading (0 on reading days)
+    span = np.maximum(next_idx - prev_idx, 1)
+    weight = (days - prev_idx) / span
+
+    return np.where(valid, prev_val + weight * (next_val - prev_val), np.nan)
+
+# stream trap files in batches and fold them into per-arm daily sums and trap counts
+def impute_arm_means(trap_files, start_unix, end_unix, batch_size=TRAP_BATCH_SIZE):
+    # pad the grid so readings just outside the window still anchor the interpolation
+    grid_start_unix = start_unix - MAX_GAP_DAYS * DAY_SECONDS
+    n_window_days = int(round((end_unix - start_unix) / DAY_SECONDS)) + 1
+    n_days = n_window_days + 2 * MAX_GAP_DAYS
+    window = slice(MAX_GAP_DAYS, MAX_GAP_DAYS + n_window_days)
+
+    sums = {arm: np.zeros(n_window_days) for arm in ARMS}
+    traps = {arm: np.zeros(n_window_days, dtype=int) for arm in ARMS}
+
+    for arm in ARMS:
+        arm_files = [f for f in trap_files if trap_arm(f) == arm]
+        for i in range(0, len(arm_files), batch_size):
+            batch = np.vstack([read_trap(f, grid_start_unix, n_days) for f in arm_files[i:i + batch_size]])
+            imputed = interpolate_rows(batch)[:, window]
+            sums[arm] += np.nansum(imputed, axis=0)
+            traps[arm] += (~np.isnan(imputed)).sum(axis=0)
+
+    means = {}
+    for arm in ARMS:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[arm] = np.where(traps[arm] > 0, sums[arm] / traps[arm], np.nan)
+    return means
+
+def main(trap_dir, start_unix, end_unix, output_file, report_file=None):
+    trap_files = sorted(glob.glob(os.path.join(trap_dir, '*.csv')))
+    trap_files = [f for f in trap_files if trap_arm(f) is not None]
+
+    if not trap_files:
+        print(f"No Treatment_*/Control_* trap files found in {trap_dir}.")
+        return
+
+    means = impute_arm_means(trap_files, start_unix, end_unix)
+
+    # egg count difference on the scale of the existing file: log10(treatment / control), positive where treatment
+    # exceeds control (the Fig. 3C script takes log1p of it, so it must stay above -1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        egg_counts_diff = np.log10(means['Treatment'] / means['Control'])
+    egg_counts_diff[~np.isfinite(egg_counts_diff)] = np.nan
+
+    start_date = local_datetimes(start_unix).normalize()
+    dates = pd.date_range(start_date, periods=len(means['Control']), freq='D')
+    result = pd.DataFrame({
+        'Timestamp': dates.strftime(OUTPUT_DATE_FORMAT),
+        'control_egg_counts': means['Control'],
+        'treatment_egg_counts': means['Treatment'],
+        'egg_counts_diff': egg_counts_diff,
+    })
+
+    # optionally carry over the cases prevented column from a sliding window report
+    if report_file is not None:
+        report = pd.read_csv(report_file, encoding='utf-8-sig')
+        report['Timestamp'] = pd.to_datetime(report['Timestamp'], dayfirst=True, errors='coerce').dt.strftime(OUTPUT_DATE_FORMAT)
+        result = result.merge(report[['Timestamp', 'CP']].rename(columns={'CP': 'treatment_mean_diff'}),
+                              on='Timestamp', how='left')
+
+    result.to_csv(output_file, index=False, na_rep='NA')
+    print(f"Imputed {len(trap_files)} traps over {len(result)} days -> {output_file}")
+    below_log1p = int(np.sum(egg_counts_diff <= -1))
+    if below_log1p:
+        print(f"Warning: {below_log1p} days have treatment below a tenth of control (egg_counts_diff <= -1) and are not plotted by the Fig. 3C script.")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (5, 6):
+        print("Usage: python impute_egg_counts_v1.py <trap_dir> <start_unix> <end_unix> <output_file> [sliding_window_report]")
+        sys.exit(1)
+
+    trap_dir = sys.argv[1]
+    start_unix = int(sys.argv[2])
+    end_unix = int(sys.argv[3])
+    output_file = sys.argv[4]
+    report_file = sys.argv[5] if len(sys.argv) == 6 else None
+
+    main(trap_dir, start_unix, end_unix, output_file, report_file)
@@ -0,0 +1,181 @@
+import sys
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2, norm
+from FET_v4 import WINDOW_DAYS, STEP_DAYS, classify_cases, local_datetimes, sliding_windows
+from chunked_aggregation_v1 import CELLS
+from results_store_v1 import write_windows
+
+# rainfall covariate: trailing rolling mean (days) and the number of quantile strata (3 = tertiles)
+ROLLING_RAINFALL_DAYS = 70
+RAINFALL_STRATA = 3
+
+# rainfall file columns
+RAINFALL_DATE_COLUMN = 'Date'
+RAINFALL_COLUMN = 'Rainfall_mm'
+
+# confidence level of the Mantel-Haenszel odds ratio
+CI_LEVEL = 0.95
+
+# continuity correction of the CMH statistic (off, as in statsmodels StratifiedTable.test_null_odds)
+CMH_CONTINUITY_CORRECTION = False
+
+# local calendar day of unix times
+def local_days(unix_times):
+    return local_datetimes(unix_times).normalize()
+
+# trailing rolling mean rainfall (mm/day) for every day of the rainfall series, from cumulative sums of the days with data
+def rolling_rainfall(rainfall, rolling_days=ROLLING_RAINFALL_DAYS):
+    rainfall = rainfall.copy()
+    rainfall[RAINFALL_DATE_COLUMN] = pd.to_datetime(rainfall[RAINFALL_DATE_COLUMN], format='%d/%m/%Y', errors='coerce')
+    rainfall[RAINFALL_COLUMN] = pd.to_numeric(rainfall[RAINFALL_COLUMN], errors='coerce')
+    series = rainfall.dropna(subset=[RAINFALL_DATE_COLUMN]).groupby(RAINFALL_DATE_COLUMN)[RAINFALL_COLUMN].mean()
+    days = pd.date_range(series.index.min(), series.index.max(), freq='D')
+    values = series.reindex(days).to_numpy()
+
+    observed = ~np.isnan(values)
+    total = np.concatenate([[0.0], np.cumsum(np.where(observed, values, 0.0))])
+    count = np.concatenate([[0], np.cumsum(observed)])
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - rolling_days, 0)
+    n = count[end] - count[start]
+    mean = np.where(n > 0, (total[end] - total[start]) / np.maximum(n, 1), np.nan)
+    return pd.Series(mean, index=days)
+
+# rolling rainfall on the day of every case (NaN outside the rainfall series)
+def case_rainfall(unix_times, rolling):
+    days = local_days(unix_times)
+    position = rolling.index.searchsorted(days)
+    found = (position < len(rolling)) & (rolling.index[np.minimum(position, len(rolling) - 1)] == days)
+    return np.where(found, rolling.to_numpy()[np.minimum(position, len(rolling) - 1)], np.nan)
+
+# quantile stratum (0 .. n_strata - 1) of every value; missing values get stratum n_strata
+def quantile_strata(values, n_strata=RAINFALL_STRATA):
+    edges = np.nanquantile(values, np.arange(1, n_strata) / n_strata)
+    return np.where(np.isnan(values), n_strata, np.digitize(values, edges))
+
+# Mantel-Haenszel odds ratio with Robins-Breslow-Greenland CI, and the CMH test, over the first axis of tables (strata, ..., 4)
+def mantel_haenszel(tables, ci_level=CI_LEVEL, correction=CMH_CONTINUITY_CORRECTION):
+    a, b, c, d = (tables[..., i].astype(float) for i in range(len(CELLS)))
+    n = a + b + c + d
+    # strata with fewer than two cases carry no information
+    informative = n > 1
+    n_safe = np.where(informative, n, 1)
+
+    r = np.where(informative, a * d / n_safe, 0)
+    s = np.where(informative, b * c / n_safe, 0)
+    p = np.where(informative, (a + d) / n_safe, 0)
+    q = np.where(informative, (b + c) / n_safe, 0)
+    sum_r, sum_s = r.sum(axis=0), s.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        odds_ratio = sum_r / sum_s
+        variance = ((p * r).sum(axis=0) / (2 * sum_r ** 2)
+                    + (p * s + q * r).sum(axis=0) / (2 * sum_r * sum_s)
+                    + (q * s).sum(axis=0) / (2 * sum_s ** 2))
+        z = norm.ppf(1 - (1 - ci_level) / 2)
+        lower = np.exp(np.log(odds_ratio) - z * np.sqrt(variance))
+        upper = np.exp(np.log(odds_ratio) + z * np.sqrt(variance))
+
+        # CMH test of a common odds ratio of 1, from a (inside zone, treatment arm) against its hypergeometric moments
+        expected = np.where(informative, (a + b) * (a + c) / n_safe, 0)
+        var_a = np.where(informative, (a + b) * (c + d) * (a + c) * (b + d) / (n_safe ** 2 * (n_safe - 1)), 0)
+        deviation = np.abs(a.sum(axis=0) - expected.sum(axis=0))
+        if correction:
+            deviation = np.maximum(deviation - 0.5, 0)
+        statistic = deviation ** 2 / var_a.sum(axis=0)
+    p_value = chi2.sf(statistic, 1)
+    return odds_ratio, lower, upper, statistic, p_value, informative.sum(axis=0)
+
+# (strata x distinct times x 4) a/b/c/d counts, with times in seconds from each season start; strata are
+# (year, region, rainfall stratum)
+def stratified_time_counts(seasons, treatment_coords, control_coords, rolling):
+    classified = []
+    for season in seasons.itertuples(index=False):
+        cases = pd.read_csv(season.cases_file)
+        cases['unix_time'] = pd.to_numeric(cases['unix_time'], errors='coerce')
+        cases = cases.dropna(subset=['unix_time', 'lat', 'lon'])
+        cases = cases[(cases['unix_time'] >= season.start_unix) & (cases['unix_time'] <= season.end_unix)]
+
+        nearest_treatment, within_zone = classify_cases(cases[['lat', 'lon']].to_numpy(), treatment_coords, control_coords)
+        classified.append(pd.DataFrame({
+            'year': season.year,
+            'region': season.region,
+            'seconds': cases['unix_time'].to_numpy().astype(np.int64) - season.start_unix,
+            'cell': np.where(within_zone, 0, 2) + np.where(nearest_treatment, 0, 1),
+            'rainfall': case_rainfall(cases['unix_time'].to_numpy(), rolling),
+        }))
+    cases = pd.concat(classified, ignore_index=True)
+
+    # rainfall strata are pooled over all seasons, so a tertile means the same rainfall in every year
+    cases['rainfall_stratum'] = quantile_strata(cases['rainfall'].to_numpy())
+    strata = cases[['year', 'region', 'rainfall_stratum']].drop_duplicates().sort_values(['year', 'region', 'rainfall_stratum'])
+    strata = strata.reset_index(drop=True)
+    stratum = cases.merge(strata.reset_index(), on=['year', 'region', 'rainfall_stratum'], how='left')['index'].to_numpy()
+
+    times, time_index = np.unique(cases['seconds'].to_numpy(), return_inverse=True)
+    counts = np.bincount((stratum * len(times) + time_index) * len(CELLS) + cases['cell'].to_numpy(),
+                         minlength=len(strata) * len(times) * len(CELLS))
+    return strata, times, counts.reshape(len(strata), len(times), len(CELLS))
+
+# a/b/c/d counts of every sliding window in every stratum, from cumulative counts over the shared time axis
+# (START <= time <= END, as in FET_v4.py), shape (strata, windows, 4)
+def stratified_window_tables(times, counts, starts, ends):
+    zeros = np.zeros(counts.shape[:1] + (1,) + counts.shape[2:], dtype=counts.dtype)
+    cumulative = np.concatenate([zeros, np.cumsum(counts, axis=1)], axis=1)
+    first = np.searchsorted(times, starts, side='left')
+    last = np.searchsorted(times, ends, side='right')
+    return cumulative[:, last] - cumulative[:, first]
+
+def main(seasons_file, treatment_sites_file, control_sites_file, rainfall_file, store_root, run):
+    seasons = pd.read_csv(seasons_file)
+    treatment_coords = pd.read_csv(treatment_sites_file)[['lat', 'lon']].to_numpy()
+    control_coords = pd.read_csv(control_sites_file)[['lat', 'lon']].to_numpy()
+    rolling = rolling_rainfall(pd.read_csv(rainfall_file, encoding='utf-8-sig'))
+
+    strata, times, counts = stratified_time_counts(seasons, treatment_coords, control_coords, rolling)
+
+    # windows on seconds from the season starts, so the same window covers the same part of every season
+    starts, ends = sliding_windows(0, (seasons['end_unix'] - seasons['start_unix']).max(), WINDOW_DAYS, STEP_DAYS)
+    tables = stratified_window_tables(times, counts, starts, ends)
+
+    odds_ratio, lower, upper, statistic, p_value, n_informative = mantel_haenszel(tables)
+    pooled = tables.sum(axis=0)
+
+    report = pd.DataFrame({
+        'START_SECONDS': starts,
+        'END_SECONDS': ends,
+        'MH_OR': odds_ratio,
+        'MH_OR_LCI': lower,
+        'MH_OR_UCI': upper,
+        'CMH_CHI2': statistic,
+        'CMH_PVAL': p_value,
+        'N_STRATA': n_informative,
+        'In treatment zone': pooled[:, 0],
+        'Outside treatment zone': pooled[:, 2],
+        'In control zone': pooled[:, 1],
+        'Outside control zone': pooled[:, 3],
+        'TOTAL': pooled.sum(axis=1),
+    })
+    # window start times of every season (exported as dates)
+    for season in seasons.itertuples(index=False):
+        report[f'START_D_{season.year}_{season.region}'] = season.start_unix + starts
+
+    # the pooled windows are stored under the regions they cover
+    region = '+'.join(sorted(seasons['region'].astype(str).unique()))
+    write_windows(report, store_root, run, region)
+    print(f"{len(report)} windows over {len(strata)} strata (year x region x rainfall) -> {store_root} (run={run}, region={region})")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 7:
+        print("Usage: python mantel_haenszel_v1.py <seasons_file> <treatment_sites_file> <control_sites_file> <rainfall_file> <store_root> <run>")
+        sys.exit(1)
+
+    seasons_file = sys.argv[1]
+    treatment_sites_file = sys.argv[2]
+    control_sites_file = sys.argv[3]
+    rainfall_file = sys.argv[4]
+    store_root = sys.argv[5]
+    run = sys.argv[6]
+
+    main(seasons_file, treatment_sites_file, control_sites_file, rainfall_file, store_root, run)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from FET_v4 import local_datetimes
+
+# encode one RGBA frame to PNG (runs in a worker process)
+def _write_frame(args):
+    import matplotlib.image as mpimg
+    path, frame = args
+    mpimg.imsave(path, frame)
+    return path
+
+# draw the static map once, then only swap the case layer per window and hand the pixels to a pool of PNG encoders;
+# density_frames is any iterable of one raster per window (e.g. the window_frames generator), read frame by frame
+def animate_case_windows(fig, ax, cases, starts, ends, output_dir, marker_colour, marker_size,
+                         density_image=None, density_frames=None, density_max=None, dpi=None, max_workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    if dpi is not None:
+        fig.set_dpi(dpi)
+
+    cases = cases.sort_values('unix_time')
+    times = cases['unix_time'].to_numpy()
+    points = cases[['lon', 'lat']].to_numpy()
+    first = np.searchsorted(times, starts, side='left')
+    last = np.searchsorted(times, ends, side='right')
+
+    # per-window artists are excluded from the background and drawn on top of it
+    case_layer = ax.scatter([], [], s=marker_size, c=marker_colour, edgecolors='black', linewidths=0.5,
+                            zorder=4, animated=True)
+    window_label = ax.text(0.02, 0.98, '', transform=ax.transAxes, ha='left', va='top', fontsize=14,
+                           bbox=dict(facecolor='white', alpha=0.8, edgecolor='none'), zorder=5, animated=True)
+    # the density raster changes per frame, so the layers above it are redrawn over it rather than kept in the background
+    overlays = []
+    if density_image is not None:
+        overlays = sorted((a for a in ax.get_children()
+                           if a.get_visible() and a is not ax.patch and a.get_zorder() > density_image.get_zorder()
+                           and a not in (case_layer, window_label)), key=lambda a: a.get_zorder())
+        for artist in [density_image] + overlays:
+            artist.set_animated(True)
+
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    start_dates = local_datetimes(starts).strftime('%d/%m/%Y')
+    end_dates = local_datetimes(ends).strftime('%d/%m/%Y')
+
+    # density frames share one colour scale (density_max, by default the maximum over all frames, which holds them in
+    # memory); cells below 5% of the maximum stay transparent
+    if density_image is not None:
+        if density_max is None:
+            density_frames = np.asarray(list(density_frames))
+            density_max = density_frames.max()
+        density_frames = iter(density_frames)
+        density_min = 0.05 * density_max if density_max > 0 else 1.0
+        density_image.set_clim(density_min, max(density_max, density_min))
+
+    paths = []
+    max_pending = 2 * (max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        for i in range(len(starts)):
+            fig.canvas.restore_region(background)
+            if density_image is not None:
+                density_image.set_data(np.ma.masked_less(next(density_frames), density_min))
+                ax.draw_artist(density_image)
+                for artist in overlays:
+                    ax.draw_artist(artist)
+            case_layer.set_offsets(points[first[i]:last[i]].reshape(-1, 2))
+            window_label.set_text(f'{start_dates[i]} - {end_dates[i]} ({last[i] - first[i]} cases)')
+            ax.draw_artist(case_layer)
+            ax.draw_artist(window_label)
+
+            frame = np.asarray(fig.canvas.buffer_rgba()).copy()
+            path = os.path.join(output_dir, f'frame_{i:04d}.png')
+            pending.append(pool.submit(_write_frame, (path, frame)))
+
+            # keep a bounded number of frames in flight
+            while len(pending) >= max_pending:
+                paths.append(pending.popleft().result())
+        paths.extend(f.result() for f in pending)
+
+    case_layer.remove()
+    window_label.remove()
+    for artist in ([density_image] + overlays if density_image is not None else []):
+        artist.set_animated(False)
+    return paths
+
+# join the PNG frames into a local video with ffmpeg, if it is installed
+def encode_video(frame_dir, output_file, fps):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        print(f"ffmpeg not found; frames are left in {frame_dir}")
+        return None
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps),
+                    '-i', os.path.join(frame_dir, 'frame_%04d.png'),
+                    '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', output_file], check=True)
+    return output_file
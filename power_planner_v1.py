@@ -0,0 +1,170 @@
+import sys
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from scipy.stats import fisher_exact
+from FET_v4 import DAY_SECONDS, STEP_DAYS, TEST_METHOD
+from chunked_aggregation_v1 import CELLS, aggregate_case_counts, daily_counts, daily_window_tables
+
+# odds ratios to simulate: the treatment inside-zone rate of the null baseline (odds ratio 1 on every day) is multiplied by
+# the effect with b, c and d unchanged; 1.0 gives the type-I error of the BH procedure
+EFFECT_SIZES = [1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2]
+
+# sliding window lengths (WINDOW_DAYS of FET_v4.sliding_windows, so a window holds window_days + 1 days) to simulate;
+# windows step by FET_v4.STEP_DAYS
+WINDOW_LENGTHS = [42, 56, 70, 84, 98]
+
+# simulated seasons per effect size and window length, and how many are simulated at once
+N_REPLICATES = 1000
+REPLICATE_BATCH = 200
+
+# FDR level of the Benjamini-Hochberg correction across windows (as in Fig. 3B)
+ALPHA = 0.05
+
+# historic daily counts are smoothed with a centred moving mean of this many days to give the expected daily rates
+RATE_SMOOTHING_DAYS = 29
+
+# optional precomputed lookup (unconditional_exact_lookup_v1.py) for FET_v4.TEST_METHOD; it must hold that test
+PVALUE_LOOKUP_FILE = None
+
+# random seed of the simulations
+SIMULATION_SEED = 1
+
+# expected a/b/c/d counts per day: centred moving mean of the historic daily counts (shorter at the ends)
+def daily_rates(daily, smoothing_days=RATE_SMOOTHING_DAYS):
+    half = smoothing_days // 2
+    cumulative = np.vstack([np.zeros((1, daily.shape[1])), np.cumsum(daily, axis=0)])
+    days = np.arange(daily.shape[0])
+    lo = np.clip(days - half, 0, daily.shape[0])
+    hi = np.clip(days + half + 1, 0, daily.shape[0])
+    return (cumulative[hi] - cumulative[lo]) / (hi - lo)[:, None]
+
+# null baseline of the daily rates: a = c * b / d on every day, so the treatment arm has the control arm's inside-zone odds
+# (the historic rates have an odds ratio of about 0.56); days without expected control outside cases use the overall b / d
+def null_rates(rates):
+    a, b, c, d = (CELLS.index(cell) for cell in ('a', 'b', 'c', 'd'))
+    overall = rates[:, b].sum() / rates[:, d].sum()
+    ratio = np.divide(rates[:, b], rates[:, d], out=np.full(len(rates), overall), where=rates[:, d] > 0)
+    baseline = rates.copy()
+    baseline[:, a] = rates[:, c] * ratio
+    return baseline
+
+# a/b/c/d counts of every sliding window of every simulated season, shape (replicates, windows, 4)
+def simulated_window_tables(rng, rates, n_replicates, window_days, step_days=STEP_DAYS):
+    daily = rng.poisson(rates, size=(n_replicates,) + rates.shape)
+    return daily_window_tables(daily, window_days, step_days)[1]
+
+# p-values of a batch of tables, computing each distinct table once and keeping them in cache across batches
+def cached_pvalues(tables, cache, lookup=None):
+    flat = tables.reshape(-1, len(CELLS))
+    unique_tables, inverse = np.unique(flat, axis=0, return_inverse=True)
+    keys = [tuple(t) for t in unique_tables.tolist()]
+
+    new = [i for i, key in enumerate(keys) if key not in cache]
+    if new:
+        a, b, c, d = unique_tables[new].T
+        if lookup is not None:
+            from unconditional_exact_lookup_v1 import lookup_pvalues
+            pvalues = lookup_pvalues(TEST_METHOD, lookup, a, b, c, d)
+        elif TEST_METHOD == 'fisher':
+            pvalues = [fisher_exact([[ai, bi], [ci, di]])[1] for ai, bi, ci, di in zip(a, b, c, d)]
+        else:
+            from unconditional_exact_lookup_v1 import direct_pvalue
+            pvalues = [direct_pvalue(TEST_METHOD, ai, bi, ci, di) for ai, bi, ci, di in zip(a, b, c, d)]
+        for i, p in zip(new, pvalues):
+            cache[keys[i]] = p
+
+    unique_pvalues = np.array([cache[key] for key in keys])
+    # tables with an empty arm or zone cannot show an effect
+    return np.nan_to_num(unique_pvalues[inverse.ravel()], nan=1.0).reshape(tables.shape[:-1])
+
+# number of windows declared significant by Benjamini-Hochberg in every replicate (rows of pvalues)
+def bh_rejections(pvalues, alpha=ALPHA):
+    n_tests = pvalues.shape[1]
+    ordered = np.sort(pvalues, axis=1)
+    passed = ordered <= np.arange(1, n_tests + 1) / n_tests * alpha
+    return np.where(passed.any(axis=1), n_tests - np.argmax(passed[:, ::-1], axis=1), 0)
+
+# power (share of seasons with at least one BH-significant window) for every effect size and window length
+def power_grid(rates, effect_sizes=EFFECT_SIZES, window_lengths=WINDOW_LENGTHS, n_replicates=N_REPLICATES,
+               seed=SIMULATION_SEED, lookup=None):
+    cache = {}
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(effect_sizes) * len(window_lengths)))
+    baseline = null_rates(rates)
+    rows = []
+    for effect in effect_sizes:
+        effect_rates = baseline.copy()
+        effect_rates[:, CELLS.index('a')] *= effect
+        for window_days in window_lengths:
+            rng = np.random.default_rng(next(seeds))
+            if window_days >= rates.shape[0]:
+                continue
+            detected = 0
+            significant_windows = 0
+            for batch_start in range(0, n_replicates, REPLICATE_BATCH):
+                n_batch = min(REPLICATE_BATCH, n_replicates - batch_start)
+                tables = simulated_window_tables(rng, effect_rates, n_batch, window_days)
+                rejections = bh_rejections(cached_pvalues(tables, cache, lookup))
+                detected += np.count_nonzero(rejections)
+                significant_windows += rejections.sum()
+            rows.append({'effect_size': effect, 'window_days': window_days,
+                         'power': detected / n_replicates,
+                         'mean_significant_windows': significant_windows / n_replicates})
+            print(f"effect {effect}, {window_days} day windows: power {detected / n_replicates:.3f} "
+                  f"({len(cache)} distinct tables tested so far)")
+    return pd.DataFrame(rows)
+
+def plot_power_curves(power, output_plot):
+    fig, ax = plt.subplots(figsize=(8, 5))
+    for window_days, curve in power.groupby('window_days'):
+        ax.plot(curve['effect_size'], curve['power'], marker='o', label=f'{window_days} day windows')
+    ax.axhline(y=0.8, color='gray', linestyle='dashed', linewidth=1)
+    ax.axhline(y=ALPHA, color='gray', linestyle='dotted', linewidth=1)
+    ax.set_xlabel('Simulated odds ratio (1 = null: type-I error)')
+    ax.set_ylabel(f'Power (BH, alpha = {ALPHA})')
+    ax.set_ylim(0, 1)
+    ax.invert_xaxis()
+    ax.grid(alpha=0.3)
+    ax.legend()
+    plt.tight_layout()
+    plt.savefig(output_plot, dpi=300)
+    plt.close(fig)
+
+def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, output_file, output_plot=None):
+    treatment_coords = pd.read_csv(treatment_sites_file)[['lat', 'lon']].to_numpy()
+    control_coords = pd.read_csv(control_sites_file)[['lat', 'lon']].to_numpy()
+
+    lookup = None
+    if PVALUE_LOOKUP_FILE is not None:
+        from unconditional_exact_lookup_v1 import load_lookup
+        lookup = load_lookup(PVALUE_LOOKUP_FILE, TEST_METHOD)
+
+    times, counts = aggregate_case_counts(cases_file, treatment_coords, control_coords, start_unix, end_unix)
+    daily = daily_counts(times, counts, start_unix, (end_unix - start_unix) // DAY_SECONDS + 1)
+    rates = daily_rates(daily)
+
+    power = power_grid(rates, lookup=lookup)
+    power.to_csv(output_file, index=False)
+    print(f"Power for {len(EFFECT_SIZES)} effect sizes x {len(WINDOW_LENGTHS)} window lengths -> {output_file}")
+
+    # at effect 1.0 the share of seasons with a significant window is the type-I error (should stay near ALPHA)
+    for row in power[power['effect_size'] == 1.0].itertuples(index=False):
+        print(f"Type-I error, {row.window_days} day windows: {row.power:.3f} (alpha = {ALPHA})")
+
+    if output_plot is not None:
+        plot_power_curves(power, output_plot)
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (7, 8):
+        print("Usage: python power_planner_v1.py <historic_cases_file> <treatment_sites_file> <control_sites_file> <start_unix> <end_unix> <output_file> [output_plot]")
+        sys.exit(1)
+
+    cases_file = sys.argv[1]
+    treatment_sites_file = sys.argv[2]
+    control_sites_file = sys.argv[3]
+    start_unix = int(sys.argv[4])
+    end_unix = int(sys.argv[5])
+    output_file = sys.argv[6]
+    output_plot = sys.argv[7] if len(sys.argv) == 8 else None
+
+    main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, output_file, output_plot)
@@ -0,0 +1,161 @@
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from FET_v4 import LOCAL_TIMEZONE, ZONE_RADIUS_KM, local_datetimes
+
+# date format of exported CSV files
+EXPORT_DATE_FORMAT = '%d/%m/%Y'
+
+# the dataset is split into one directory per run, region and zone radius
+PARTITION_SCHEMA = pa.schema([
+    ('run', pa.string()),
+    ('region', pa.string()),
+    ('radius_m', pa.int32()),
+])
+
+# zone radius partition of windows written by the analysis scripts
+RADIUS_M = int(round(ZONE_RADIUS_KM * 1000))
+
+# typed window-level columns (other columns, e.g. replicate p-values RAND_PVAL_<i> or model estimates, are kept with
+# their own numeric type, and date columns are stored as epoch seconds)
+WINDOW_SCHEMA = pa.schema([
+    ('Timestamp', pa.int64()),
+    ('START', pa.int64()),
+    ('END', pa.int64()),
+    ('PVAL', pa.float64()),
+    ('OR', pa.float64()),
+    ('OR_CI_LOWER', pa.float64()),
+    ('OR_CI_UPPER', pa.float64()),
+    ('CP', pa.float64()),
+    ('CP_CI_LOWER', pa.float64()),
+    ('CP_CI_UPPER', pa.float64()),
+    ('In treatment zone', pa.int32()),
+    ('Outside treatment zone', pa.int32()),
+    ('In control zone', pa.int32()),
+    ('Outside control zone', pa.int32()),
+    ('TOTAL', pa.int32()),
+])
+
+# other date columns of the window reports (START_D, END_D, Date 4.8 Months Before Center, START_D_<year>_<region>)
+DATE_COLUMN_PREFIXES = ('START_D', 'END_D', 'Date')
+
+def is_date_column(name):
+    return name in ('Timestamp', 'START', 'END') or str(name).startswith(DATE_COLUMN_PREFIXES)
+
+# window bounds that the reports (and exports) keep as integer epoch seconds
+EPOCH_COLUMNS = ('START', 'END')
+
+# epoch seconds of local calendar dates
+def local_dates_to_epoch(dates):
+    dates = pd.to_datetime(dates).dt.tz_localize(LOCAL_TIMEZONE)
+    return (dates - pd.Timestamp('1970-01-01', tz='UTC')) // pd.Timedelta('1s')
+
+# local (timezone naive) datetimes of epoch seconds, for plotting
+def epoch_to_local_dates(epochs):
+    return local_datetimes(epochs)
+
+# convert a window frame to the typed schema, keeping every other column: day-first date strings become epoch seconds of
+# the local date, integer columns int64, other numeric columns float64 and anything else strings
+def to_table(df):
+    columns = [f.name for f in WINDOW_SCHEMA]
+    fields = list(WINDOW_SCHEMA)
+    for column in df.columns:
+        if column in columns:
+            continue
+        values = df[column]
+        if is_date_column(column) and not pd.api.types.is_numeric_dtype(values):
+            fields.append(pa.field(column, pa.int64()))
+        elif pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+            fields.append(pa.field(column, pa.int64()))
+        elif pd.api.types.is_numeric_dtype(values):
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+
+    df = df.reindex(columns=[f.name for f in fields])
+    arrays = []
+    for field in fields:
+        values = df[field.name]
+        if pa.types.is_string(field.type):
+            arrays.append(pa.array(values.astype('string'), type=field.type, from_pandas=True))
+            continue
+        if is_date_column(field.name) and not pd.api.types.is_numeric_dtype(values):
+            values = local_dates_to_epoch(pd.to_datetime(values, dayfirst=True, errors='coerce'))
+        values = pd.to_numeric(values, errors='coerce')
+        if pa.types.is_integer(field.type):
+            arrays.append(pa.array(values.round().astype('Int64'), type=field.type))
+        else:
+            arrays.append(pa.array(values.to_numpy(dtype='float64'), type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+# read a legacy sliding window report CSV (day-first date strings are converted by to_table)
+def from_report_csv(report_file):
+    return pd.read_csv(report_file, encoding='utf-8-sig')
+
+# write (or replace) the windows of one run, region and radius
+def write_windows(df, store_root, run, region, radius_m=RADIUS_M):
+    table = to_table(df)
+    n = table.num_rows
+    table = table.append_column('run', pa.array([run] * n, pa.string()))
+    table = table.append_column('region', pa.array([region] * n, pa.string()))
+    table = table.append_column('radius_m', pa.array([radius_m] * n, pa.int32()))
+    ds.write_dataset(table, store_root, format='parquet',
+                     partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'),
+                     basename_template='windows-{i}.parquet',
+                     existing_data_behavior='delete_matching')
+
+# dataset of the matching partitions and its filter
+def matching_windows(store_root, run=None, region=None, radius_m=None):
+    partitioning = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+    dataset = ds.dataset(store_root, format='parquet', partitioning=partitioning)
+    condition = None
+    for name, value in (('run', run), ('region', region), ('radius_m', radius_m)):
+        if value is not None:
+            term = ds.field(name) == value
+            condition = term if condition is None else condition & term
+
+    # runs can carry different extra columns, so the schema is the union over the matching files
+    fragments = list(dataset.get_fragments(filter=condition))
+    if fragments:
+        schema = pa.unify_schemas([f.physical_schema for f in fragments] + [PARTITION_SCHEMA])
+        dataset = ds.dataset(store_root, schema=schema, format='parquet', partitioning=partitioning)
+    return dataset, condition
+
+# read only the requested columns of the matching partitions
+def read_windows(store_root, columns=None, run=None, region=None, radius_m=None):
+    dataset, condition = matching_windows(store_root, run, region, radius_m)
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+# column names of the matching partitions (e.g. to select the RAND_PVAL_<i> replicate columns before reading)
+def window_columns(store_root, run=None, region=None, radius_m=None):
+    return matching_windows(store_root, run, region, radius_m)[0].schema.names
+
+# export windows as CSV with START/END as integer epoch seconds, as in the reports, and every other date column as a
+# date string in one format (the partition columns are given by the export arguments and left out)
+def export_csv(df, output_file):
+    df = df.drop(columns=PARTITION_SCHEMA.names, errors='ignore')
+    for column in df.columns:
+        if column in EPOCH_COLUMNS:
+            df[column] = df[column].astype('Int64')
+        elif is_date_column(column):
+            df[column] = epoch_to_local_dates(df[column]).dt.strftime(EXPORT_DATE_FORMAT)
+    df.to_csv(output_file, index=False)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 7 or sys.argv[1] not in ('import', 'export'):
+        print("Usage: python results_store_v1.py import <report_csv> <store_root> <run> <region> <radius_m>")
+        print("       python results_store_v1.py export <store_root> <run> <region> <radius_m> <output_csv>")
+        sys.exit(1)
+
+    if sys.argv[1] == 'import':
+        report_file, store_root, run, region, radius_m = sys.argv[2:7]
+        windows = from_report_csv(report_file)
+        write_windows(windows, store_root, run, region, int(radius_m))
+        print(f"Stored {len(windows)} windows under {store_root} (run={run}, region={region}, radius_m={radius_m})")
+    else:
+        store_root, run, region, radius_m, output_file = sys.argv[2:7]
+        windows = read_windows(store_root, run=run, region=region, radius_m=int(radius_m))
+        # columns of the shared schema that this run does not fill are left out of the export
+        export_csv(windows.sort_values('START', kind='stable').dropna(axis=1, how='all'), output_file)
+        print(f"Exported {len(windows)} windows -> {output_file}")
@@ -0,0 +1,203 @@
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from FET_v4 import DAY_SECONDS, METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON, local_datetimes, spherical_distances
+
+# candidate circle radii (km) around each centre
+SCAN_RADII_KM = [0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.6, 2.0]
+
+# candidate time interval lengths (days)
+SCAN_WINDOW_DAYS = [14, 28, 42, 56, 70, 84]
+
+# optional spacing (km) of extra grid centres over the site bounding box (None uses the sites only)
+GRID_SPACING_KM = None
+
+# cluster direction: 'excess', 'deficit' or 'both'
+SCAN_DIRECTION = 'both'
+
+# number of Monte Carlo replicates (p-values have a resolution of 1 / (N_REPLICATES + 1))
+N_REPLICATES = 999
+
+# replicates handed to one worker process at a time
+REPLICATE_CHUNK_SIZE = 50
+
+# seed for the Monte Carlo replicates
+SCAN_SEED = 1
+
+# add a regular grid of centres (spacing in km) over the bounding box of the sites
+def grid_centres(site_coords, spacing_km, margin_km):
+    lat_mid = np.radians(site_coords[:, 0].mean())
+    km_per_degree_lat = METERS_PER_DEGREE_LAT / 1000
+    km_per_degree_lon = METERS_PER_DEGREE_LON / 1000 * np.cos(lat_mid)
+    dlat = spacing_km / km_per_degree_lat
+    dlon = spacing_km / km_per_degree_lon
+    lat_pad = margin_km / km_per_degree_lat
+    lon_pad = margin_km / km_per_degree_lon
+    lats = np.arange(site_coords[:, 0].min() - lat_pad, site_coords[:, 0].max() + lat_pad + dlat, dlat)
+    lons = np.arange(site_coords[:, 1].min() - lon_pad, site_coords[:, 1].max() + lon_pad + dlon, dlon)
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+    return np.column_stack([lat_grid.ravel(), lon_grid.ravel()])
+
+# for every centre keep only the cases inside the largest radius, sorted by distance, and the rank cut-off of every radius
+def centre_ranks(case_coords, centre_coords, radii_km):
+    distances = spherical_distances(case_coords, centre_coords)
+    ranked_cases = []
+    radius_ranks = np.zeros((len(centre_coords), len(radii_km)), dtype=int)
+    for c in range(len(centre_coords)):
+        inside = np.flatnonzero(distances[:, c] <= radii_km[-1])
+        order = inside[np.argsort(distances[inside, c], kind='stable')]
+        ranked_cases.append(order)
+        radius_ranks[c] = np.searchsorted(distances[order, c], radii_km, side='right')
+    return ranked_cases, radius_ranks
+
+# Kulldorff log likelihood ratio for observed c against expected mu out of n cases (0 where the direction does not match)
+def log_likelihood_ratio(c, mu, n, direction=SCAN_DIRECTION):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inside = np.where(c > 0, c * np.log(c / mu), 0.0)
+        outside = np.where(n - c > 0, (n - c) * np.log((n - c) / (n - mu)), 0.0)
+        llr = np.nan_to_num(inside + outside, nan=0.0, posinf=0.0)
+    if direction == 'excess':
+        llr = np.where(c > mu, llr, 0.0)
+    elif direction == 'deficit':
+        llr = np.where(c < mu, llr, 0.0)
+    return llr
+
+# evaluate every (radius, start, length) cylinder of one centre and return the LLR array (radii x starts x lengths)
+def centre_llr(case_days, ranked, radius_ranks, all_cum, n_days, window_days, direction):
+    n_cases = len(case_days)
+    n_radii = len(radius_ranks)
+
+    # daily counts of each circle, built up ring by ring from the distance ranks
+    circle_counts = np.zeros((n_radii, n_days))
+    running = np.zeros(n_days)
+    previous = 0
+    for r, k in enumerate(radius_ranks):
+        if k > previous:
+            running = running + np.bincount(case_days[ranked[previous:k]], minlength=n_days)
+        circle_counts[r] = running
+        previous = k
+    circle_cum = np.concatenate([np.zeros((n_radii, 1)), np.cumsum(circle_counts, axis=1)], axis=1)
+    circle_totals = circle_cum[:, -1]
+
+    starts = np.arange(n_days)
+    ends = starts[:, None] + window_days[None, :]
+    valid = ends <= n_days
+    ends = np.minimum(ends, n_days)
+
+    observed = circle_cum[:, ends] - circle_cum[:, starts][:, :, None]
+    interval_totals = all_cum[ends] - all_cum[starts][:, None]
+    expected = circle_totals[:, None, None] * interval_totals[None, :, :] / n_cases
+
+    llr = log_likelihood_ratio(observed, expected, n_cases, direction)
+    return np.where(valid[None, :, :], llr, 0.0), observed, expected
+
+# largest LLR over all centres and cylinders for one set of case days
+def max_llr(case_days, ranked_cases, radius_ranks, n_days, window_days, direction):
+    all_cum = np.concatenate([[0], np.cumsum(np.bincount(case_days, minlength=n_days))])
+    best = 0.0
+    for ranked, ranks in zip(ranked_cases, radius_ranks):
+        llr, _, _ = centre_llr(case_days, ranked, ranks, all_cum, n_days, window_days, direction)
+        best = max(best, llr.max())
+    return best
+
+# shared state of the worker processes (set once per worker rather than pickled per replicate)
+_worker_state = {}
+
+def _init_worker(case_days, ranked_cases, radius_ranks, n_days, window_days, direction):
+    _worker_state.update(case_days=case_days, ranked_cases=ranked_cases, radius_ranks=radius_ranks,
+                         n_days=n_days, window_days=window_days, direction=direction)
+
+# permute the case days (space-time permutation null) and return the maximum LLR of each replicate
+def _replicate_chunk(args):
+    n_replicates, seed = args
+    rng = np.random.default_rng(seed)
+    s = _worker_state
+    return [max_llr(rng.permutation(s['case_days']), s['ranked_cases'], s['radius_ranks'],
+                    s['n_days'], s['window_days'], s['direction'])
+            for _ in range(n_replicates)]
+
+def monte_carlo_max_llr(case_days, ranked_cases, radius_ranks, n_days, window_days, direction,
+                        n_replicates=N_REPLICATES, chunk_size=REPLICATE_CHUNK_SIZE, seed=SCAN_SEED, max_workers=None):
+    chunks = [min(chunk_size, n_replicates - i) for i in range(0, n_replicates, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(case_days, ranked_cases, radius_ranks, n_days, window_days, direction)) as pool:
+        return np.concatenate([np.asarray(r) for r in pool.map(_replicate_chunk, zip(chunks, seeds))])
+
+def main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, output_file):
+    cases = pd.read_csv(cases_file)
+    treatment_sites = pd.read_csv(treatment_sites_file)
+    control_sites = pd.read_csv(control_sites_file)
+
+    cases["unix_time"] = pd.to_numeric(cases["unix_time"], errors="coerce")
+    cases = cases[(cases['unix_time'] >= start_unix) & (cases['unix_time'] <= end_unix)].copy()
+
+    if cases.empty:
+        print("No cases found in the specified time window.")
+        return
+
+    # centres are the treatment and control sites, plus optional grid points
+    centre_names = list(treatment_sites.iloc[:, 0]) + list(control_sites.iloc[:, 0])
+    centre_coords = np.vstack([treatment_sites[['lat', 'lon']].to_numpy(), control_sites[['lat', 'lon']].to_numpy()])
+    if GRID_SPACING_KM is not None:
+        grid = grid_centres(centre_coords, GRID_SPACING_KM, max(SCAN_RADII_KM))
+        centre_names += [f'G{i + 1}' for i in range(len(grid))]
+        centre_coords = np.vstack([centre_coords, grid])
+
+    radii_km = np.sort(np.asarray(SCAN_RADII_KM, dtype=float))
+    window_days = np.asarray(SCAN_WINDOW_DAYS, dtype=int)
+    n_days = int(round((end_unix - start_unix) / DAY_SECONDS)) + 1
+    case_days = np.clip(np.rint((cases['unix_time'].to_numpy() - start_unix) / DAY_SECONDS).astype(int), 0, n_days - 1)
+    n_cases = len(case_days)
+
+    ranked_cases, radius_ranks = centre_ranks(cases[['lat', 'lon']].to_numpy(), centre_coords, radii_km)
+
+    # best cylinder of every centre for the observed data
+    all_cum = np.concatenate([[0], np.cumsum(np.bincount(case_days, minlength=n_days))])
+    rows = []
+    for name, coords, ranked, ranks in zip(centre_names, centre_coords, ranked_cases, radius_ranks):
+        llr, observed, expected = centre_llr(case_days, ranked, ranks, all_cum, n_days, window_days, SCAN_DIRECTION)
+        r, s, l = np.unravel_index(np.argmax(llr), llr.shape)
+        rows.append({
+            'centre': name,
+            'lat': coords[0],
+            'lon': coords[1],
+            'type': 'excess' if observed[r, s, l] > expected[r, s, l] else 'deficit',
+            'radius_km': radii_km[r],
+            'START': start_unix + s * DAY_SECONDS,
+            'END': start_unix + (s + window_days[l] - 1) * DAY_SECONDS,
+            'window_days': window_days[l],
+            'observed': observed[r, s, l],
+            'expected': expected[r, s, l],
+            'LLR': llr[r, s, l],
+        })
+    clusters = pd.DataFrame(rows).sort_values('LLR', ascending=False)
+
+    # Monte Carlo p-values against the distribution of the maximum LLR
+    replicate_llr = monte_carlo_max_llr(case_days, ranked_cases, radius_ranks, n_days, window_days, SCAN_DIRECTION)
+    clusters['PVAL'] = [(1 + np.sum(replicate_llr >= v)) / (1 + len(replicate_llr)) for v in clusters['LLR']]
+
+    clusters['START_D'] = local_datetimes(clusters['START']).dt.strftime('%d/%m/%Y')
+    clusters['END_D'] = local_datetimes(clusters['END']).dt.strftime('%d/%m/%Y')
+    clusters.to_csv(output_file, index=False)
+
+    top = clusters.iloc[0]
+    print(f"Scanned {len(centre_coords)} centres x {len(radii_km)} radii x {len(window_days)} window lengths over {n_cases} cases.")
+    print(f"Most likely cluster: {top['centre']} ({top['type']}), radius {top['radius_km']} km, "
+          f"{top['START_D']} - {top['END_D']}, observed {top['observed']:.0f} vs expected {top['expected']:.1f}, "
+          f"LLR {top['LLR']:.2f}, p = {top['PVAL']:.4f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 7:
+        print("Usage: python scan_statistic_v1.py <cases_file> <treatment_sites_file> <control_sites_file> <start_unix> <end_unix> <output_file>")
+        sys.exit(1)
+
+    cases_file = sys.argv[1]
+    treatment_sites_file = sys.argv[2]
+    control_sites_file = sys.argv[3]
+    start_unix = int(sys.argv[4])
+    end_unix = int(sys.argv[5])
+    output_file = sys.argv[6]
+
+    main(cases_file, treatment_sites_file, control_sites_file, start_unix, end_unix, output_file)
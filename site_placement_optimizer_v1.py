@@ -0,0 +1,223 @@
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm
+from FET_v4 import ZONE_RADIUS_KM, WINDOW_DAYS, DAY_SECONDS, METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON, spherical_distances
+
+# spacing (km) of the candidate site grid over the study area
+CANDIDATE_SPACING_KM = 0.25
+
+# area searched for candidate sites (min_lon, max_lon, min_lat, max_lat), as in Fig. 1B
+CANDIDATE_BBOX = (144.86, 144.986887, -37.785, -37.714593)
+
+# objective: 'power' (expected power to detect EFFECT_ODDS_RATIO) or 'balance' (equal case counts in both arms)
+OBJECTIVE = 'power'
+
+# odds ratio the next intervention is expected to achieve, and the test level
+EFFECT_ODDS_RATIO = 0.3
+ALPHA = 0.05
+
+# allowed number of sites per arm (equal bounds only allow moves, wider bounds also allow adding or removing sites)
+MIN_SITES_PER_ARM = 6
+MAX_SITES_PER_ARM = 6
+
+# smallest distance (km) between a treatment and a control site, so that no case can be inside the zones of both arms
+MIN_ARM_SEPARATION_KM = 2 * ZONE_RADIUS_KM
+
+# largest number of improving changes applied
+MAX_CHANGES = 50
+
+# candidate sites handed to one worker process at a time
+CANDIDATE_CHUNK_SIZE = 200
+
+ARMS = ['Treatment', 'Control']
+
+# regular grid of candidate locations
+def candidate_grid(bbox=CANDIDATE_BBOX, spacing_km=CANDIDATE_SPACING_KM):
+    min_lon, max_lon, min_lat, max_lat = bbox
+    lat_mid = np.radians((min_lat + max_lat) / 2)
+    lats = np.arange(min_lat, max_lat, spacing_km * 1000 / METERS_PER_DEGREE_LAT)
+    lons = np.arange(min_lon, max_lon, spacing_km * 1000 / (METERS_PER_DEGREE_LON * np.cos(lat_mid)))
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing='ij')
+    return np.column_stack([lat_grid.ravel(), lon_grid.ravel()])
+
+# contingency cell of every case: 0 = a (treatment inside), 1 = b (control inside), 2 = c (treatment outside), 3 = d (control outside)
+def case_cells(d_treatment, d_control):
+    nearest_treatment = d_treatment < d_control
+    d_nearest = np.where(nearest_treatment, d_treatment, d_control)
+    return np.where(d_nearest <= ZONE_RADIUS_KM, 0, 2) + np.where(nearest_treatment, 0, 1)
+
+# nearest-site distance and nearest-site candidate index per arm, and the a/b/c/d counts of a layout
+def layout_state(distances, layout):
+    state = {}
+    for arm in ARMS:
+        sites = np.asarray(layout[arm])
+        columns = distances[:, sites]
+        state[arm] = {'distance': columns.min(axis=1), 'site': sites[columns.argmin(axis=1)]}
+    cells = case_cells(state['Treatment']['distance'], state['Control']['distance'])
+    state['counts'] = np.bincount(cells, minlength=4)
+    return state
+
+# counts after removing remove_site and/or adding add_site in one arm, recounting only the cases whose nearest site changes
+def changed_counts(distances, layout, state, arm, remove_site=None, add_site=None):
+    d_arm = state[arm]['distance']
+    site_arm = state[arm]['site']
+
+    affected = np.zeros(len(d_arm), dtype=bool)
+    if remove_site is not None:
+        affected |= site_arm == remove_site
+    if add_site is not None:
+        affected |= distances[:, add_site] < d_arm
+    rows = np.flatnonzero(affected)
+    if rows.size == 0:
+        return state['counts'].copy(), rows, None, None
+
+    sites = [s for s in layout[arm] if s != remove_site] + ([add_site] if add_site is not None else [])
+    sites = np.asarray(sites)
+    columns = distances[np.ix_(rows, sites)]
+    new_distance = columns.min(axis=1)
+    new_site = sites[columns.argmin(axis=1)]
+
+    other = 'Control' if arm == 'Treatment' else 'Treatment'
+    d_other = state[other]['distance'][rows]
+    if arm == 'Treatment':
+        old_cells = case_cells(d_arm[rows], d_other)
+        new_cells = case_cells(new_distance, d_other)
+    else:
+        old_cells = case_cells(d_other, d_arm[rows])
+        new_cells = case_cells(d_other, new_distance)
+
+    counts = state['counts'] - np.bincount(old_cells, minlength=4) + np.bincount(new_cells, minlength=4)
+    return counts, rows, new_distance, new_site
+
+# expected power of a two-sided Wald test of the log odds ratio (Haldane correction) for the expected window counts
+def expected_power(counts, scale, odds_ratio=EFFECT_ODDS_RATIO, alpha=ALPHA):
+    a, b, c, d = counts * scale
+    n_treatment, n_control = a + c, b + d
+    if n_treatment <= 0 or n_control <= 0:
+        return 0.0
+    # without an effect both arms share the pooled inside proportion; the effect scales the treatment inside odds
+    p0 = (a + b) / (n_treatment + n_control)
+    if p0 <= 0 or p0 >= 1:
+        return 0.0
+    odds_treatment = odds_ratio * p0 / (1 - p0)
+    p_treatment = odds_treatment / (1 + odds_treatment)
+    cells = np.array([n_treatment * p_treatment, n_control * p0, n_treatment * (1 - p_treatment), n_control * (1 - p0)])
+    se = np.sqrt(np.sum(1 / (cells + 0.5)))
+    return float(norm.cdf(abs(np.log(odds_ratio)) / se - norm.ppf(1 - alpha / 2)))
+
+def score(counts, scale, objective=OBJECTIVE):
+    if objective == 'balance':
+        a, b, c, d = counts
+        total = counts.sum()
+        return -abs((a + c) - (b + d)) / total if total > 0 else 0.0
+    return expected_power(counts, scale)
+
+# every single-site change allowed from the current layout: (arm, remove_site, add_site); an added site must be at least
+# MIN_ARM_SEPARATION_KM from every site of the other arm (too_close[i, j] marks candidate pairs closer than that)
+def possible_changes(layout, candidates_chunk, too_close):
+    used = set(layout['Treatment']) | set(layout['Control'])
+    changes = []
+    for arm in ARMS:
+        other = layout['Control' if arm == 'Treatment' else 'Treatment']
+        blocked = too_close[np.ix_(candidates_chunk, other)].any(axis=1)
+        free = [j for j, b in zip(candidates_chunk, blocked) if j not in used and not b]
+        for s in layout[arm]:
+            changes += [(arm, s, j) for j in free]
+            if len(layout[arm]) > MIN_SITES_PER_ARM:
+                changes.append((arm, s, None))
+        if len(layout[arm]) < MAX_SITES_PER_ARM:
+            changes += [(arm, None, j) for j in free]
+    return changes
+
+# shared case-candidate distances and candidate separation flags of the worker processes (sent once per worker)
+_worker_state = {}
+
+def _init_worker(distances, too_close, scale, objective):
+    _worker_state.update(distances=distances, too_close=too_close, scale=scale, objective=objective)
+
+# best change among the candidate sites of one chunk
+def _best_in_chunk(args):
+    layout, state, candidates_chunk = args
+    distances = _worker_state['distances']
+    best = (-np.inf, None)
+    for arm, remove_site, add_site in possible_changes(layout, candidates_chunk, _worker_state['too_close']):
+        counts, _, _, _ = changed_counts(distances, layout, state, arm, remove_site, add_site)
+        value = score(counts, _worker_state['scale'], _worker_state['objective'])
+        if value > best[0]:
+            best = (value, (arm, remove_site, add_site))
+    return best
+
+# greedy local search: apply the best single-site change until none improves the objective
+def optimise_layout(distances, too_close, layout, scale, objective=OBJECTIVE, max_workers=None):
+    state = layout_state(distances, layout)
+    current = score(state['counts'], scale, objective)
+    history = [(None, current, state['counts'].copy())]
+    chunks = [list(range(i, min(i + CANDIDATE_CHUNK_SIZE, distances.shape[1])))
+              for i in range(0, distances.shape[1], CANDIDATE_CHUNK_SIZE)]
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(distances, too_close, scale, objective)) as pool:
+        for _ in range(MAX_CHANGES):
+            results = pool.map(_best_in_chunk, [(layout, state, chunk) for chunk in chunks])
+            value, change = max(results, key=lambda r: r[0])
+            if change is None or value <= current + 1e-12:
+                break
+
+            arm, remove_site, add_site = change
+            layout[arm] = [s for s in layout[arm] if s != remove_site] + ([add_site] if add_site is not None else [])
+            state = layout_state(distances, layout)
+            current = value
+            history.append((change, current, state['counts'].copy()))
+            print(f"{arm}: {remove_site} -> {add_site}, {objective} = {current:.4f}, a/b/c/d = {state['counts'].tolist()}")
+    return layout, history
+
+def main(cases_file, treatment_sites_file, control_sites_file, output_file):
+    cases = pd.read_csv(cases_file)
+    treatment_sites = pd.read_csv(treatment_sites_file)
+    control_sites = pd.read_csv(control_sites_file)
+    cases['unix_time'] = pd.to_numeric(cases['unix_time'], errors='coerce')
+    cases = cases.dropna(subset=['unix_time', 'lat', 'lon'])
+
+    # candidates are the current sites followed by the grid
+    site_names = list(treatment_sites.iloc[:, 0]) + list(control_sites.iloc[:, 0])
+    site_coords = np.vstack([treatment_sites[['lat', 'lon']].to_numpy(), control_sites[['lat', 'lon']].to_numpy()])
+    candidate_coords = np.vstack([site_coords, candidate_grid()])
+    candidate_names = site_names + [f'G{i + 1}' for i in range(len(candidate_coords) - len(site_names))]
+    layout = {'Treatment': list(range(len(treatment_sites))),
+              'Control': list(range(len(treatment_sites), len(site_names)))}
+
+    distances = spherical_distances(cases[['lat', 'lon']].to_numpy(), candidate_coords)
+    too_close = spherical_distances(candidate_coords, candidate_coords) < MIN_ARM_SEPARATION_KM
+
+    # current sites closer than the separation are kept, but no change may add such a pair
+    n_close = too_close[np.ix_(layout['Treatment'], layout['Control'])].sum()
+    if n_close:
+        print(f"Warning: {n_close} current treatment-control site pairs are closer than {MIN_ARM_SEPARATION_KM} km")
+
+    # historic counts are scaled to the expected counts of one window
+    span_days = max((cases['unix_time'].max() - cases['unix_time'].min()) / DAY_SECONDS, WINDOW_DAYS)
+    scale = WINDOW_DAYS / span_days
+
+    layout, history = optimise_layout(distances, too_close, layout, scale)
+
+    rows = []
+    for arm in ARMS:
+        for site in layout[arm]:
+            rows.append({'arm': arm, 'site': candidate_names[site],
+                         'lat': candidate_coords[site, 0], 'lon': candidate_coords[site, 1]})
+    pd.DataFrame(rows).to_csv(output_file, index=False)
+    print(f"{OBJECTIVE}: {history[0][1]:.4f} -> {history[-1][1]:.4f} after {len(history) - 1} changes; layout -> {output_file}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print("Usage: python site_placement_optimizer_v1.py <historic_cases_file> <treatment_sites_file> <control_sites_file> <output_file>")
+        sys.exit(1)
+
+    cases_file = sys.argv[1]
+    treatment_sites_file = sys.argv[2]
+    control_sites_file = sys.argv[3]
+    output_file = sys.argv[4]
+
+    main(cases_file, treatment_sites_file, control_sites_file, output_file)
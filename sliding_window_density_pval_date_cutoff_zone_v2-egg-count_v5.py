@@ -3,6 +3,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from dateutil.relativedelta import relativedelta
+from dense_timeseries_render_v1 import add_replicate_lines, save_formats
 
 # X-axis tick interval
 X_AXIS_TICK_INTERVAL = 5
@@ -17,6 +18,18 @@ ACTUAL_2023_WIDTH = 3
 MEDIAN_RANDOM_COLOR = '#000000'
 MEDIAN_RANDOM_WIDTH = 3
 
+# random replicate layers (replicate lines, median, IQR and 95th percentile bands)
+SHOW_REPLICATES = False
+REPLICATE_LINE_COLOR = '#999999'
+REPLICATE_LINE_WIDTH = 0.5
+REPLICATE_LINE_ALPHA = 0.05
+
+# resolution of the rasterised replicate layers inside the SVG, resolution of the PNG (None = figure dpi, 1200 x 600 px),
+# and the exported formats
+RASTER_DPI = 300
+PNG_DPI = None
+OUTPUT_FORMATS = ['svg', 'png']
+
 # horizontal lines
 PVALUE_THRESHOLD_COLOR = '#000000'
 PVALUE_THRESHOLD_WIDTH = 1.5
@@ -60,16 +73,44 @@ Y_AXIS_LABEL_FONT_SIZE = 20
 # colour of the two vertical lines
 VERTICAL_INTERVENTION_COLOR = '#0072B2' # Blue
 
-# load the CSV file
-file_path = '4.5-DATE_ESSENDON-AIRPORT_RAINFALL_2023-48_AND_2024-70_sliding_window_Haversine_zone-800m_FET_v1-PVAL_rand-coords_report_ACTUAL_AND_RAND.csv'
-data = pd.read_csv(file_path, header=None)
-
-# define column names
-data.columns = ['Date', '2024_actual_p-values', '2023_actual_p-values', 'Egg_counts'] + \
-               [f'Random_{i}' for i in range(1, data.shape[1] - 4 + 1)]
-
-# convert Date column to datetime format
-data['Date'] = pd.to_datetime(data['Date'], format='%d/%m/%Y', errors='coerce')
+# optional columnar results store (None reads the CSV report below): the 2024 run with its RAND_PVAL_<i> replicate
+# p-values, and the 2023 run, whose windows are moved forward one year onto the 2024 dates
+RESULTS_STORE = None
+RESULTS_RUN_2024 = 'Essendon_2024_symptom_70'
+RESULTS_RUN_2023 = 'Essendon_2023_symptom_48'
+RESULTS_REGION = 'Inner_northwest'
+RESULTS_RADIUS_M = 800
+
+if RESULTS_STORE is not None:
+    from results_store_v1 import read_windows, window_columns, epoch_to_local_dates
+
+    # read only the window dates, p-values and replicate p-values of the two runs
+    replicate_columns = [c for c in window_columns(RESULTS_STORE, run=RESULTS_RUN_2024, region=RESULTS_REGION,
+                                                   radius_m=RESULTS_RADIUS_M) if c.startswith('RAND_PVAL_')]
+    windows_2024 = read_windows(RESULTS_STORE, columns=['Timestamp', 'PVAL'] + replicate_columns,
+                                run=RESULTS_RUN_2024, region=RESULTS_REGION, radius_m=RESULTS_RADIUS_M)
+    windows_2023 = read_windows(RESULTS_STORE, columns=['Timestamp', 'PVAL'],
+                                run=RESULTS_RUN_2023, region=RESULTS_REGION, radius_m=RESULTS_RADIUS_M)
+    windows_2024['Date'] = epoch_to_local_dates(windows_2024['Timestamp']).dt.normalize()
+    windows_2023['Date'] = epoch_to_local_dates(windows_2023['Timestamp']).dt.normalize() + pd.DateOffset(years=1)
+
+    # same column layout as the CSV report (the rainfall column is not a window output and is left empty)
+    data = windows_2024[['Date', 'PVAL']].rename(columns={'PVAL': '2024_actual_p-values'})
+    data = data.merge(windows_2023[['Date', 'PVAL']].rename(columns={'PVAL': '2023_actual_p-values'}), on='Date', how='left')
+    data['Egg_counts'] = np.nan
+    replicates = windows_2024[replicate_columns].set_axis([f'Random_{i}' for i in range(1, len(replicate_columns) + 1)], axis=1)
+    data = pd.concat([data, replicates], axis=1)
+else:
+    # load the CSV file
+    file_path = '4.5-DATE_ESSENDON-AIRPORT_RAINFALL_2023-48_AND_2024-70_sliding_window_Haversine_zone-800m_FET_v1-PVAL_rand-coords_report_ACTUAL_AND_RAND.csv'
+    data = pd.read_csv(file_path, header=None)
+
+    # define column names
+    data.columns = ['Date', '2024_actual_p-values', '2023_actual_p-values', 'Egg_counts'] + \
+                   [f'Random_{i}' for i in range(1, data.shape[1] - 4 + 1)]
+
+    # convert Date column to datetime format
+    data['Date'] = pd.to_datetime(data['Date'], format='%d/%m/%Y', errors='coerce')
 
 # filter out invalid dates
 data = data.dropna(subset=['Date'])
@@ -117,9 +158,12 @@ fig, ax1 = plt.subplots(figsize=(12, 6))
 ax1.plot(data['Date'], actual_control_data, color=ACTUAL_2023_COLOR, linewidth=ACTUAL_2023_WIDTH, label='2023 cases')
 ax1.plot(data['Date'], actual_treatment_data, color=ACTUAL_2024_COLOR, linewidth=ACTUAL_2024_WIDTH, label='2024 cases')
 ax1.axhline(y=bh_threshold, color=BH_THRESHOLD_COLOR, linestyle='dashed', linewidth=BH_THRESHOLD_WIDTH, label='BH corrected threshold')
-#ax1.plot(data['Date'], median_random, color=MEDIAN_RANDOM_COLOR, linestyle='-', linewidth=MEDIAN_RANDOM_WIDTH, label='Median of random data')
-#ax1.fill_between(data['Date'], lower_iqr, upper_iqr, color='gray', alpha=0.4, label='IQR (25%-75%)')
-#ax1.fill_between(data['Date'], lower_p_threshold, upper_p_threshold, color='gray', alpha=0.2, label='95th percentile of random')
+
+# random replicate summaries as vector lines (the replicate lines are added once the axes limits are set)
+if SHOW_REPLICATES:
+    ax1.plot(data['Date'], median_random, color=MEDIAN_RANDOM_COLOR, linestyle='-', linewidth=MEDIAN_RANDOM_WIDTH, label='Median of random data')
+    ax1.fill_between(data['Date'], lower_iqr, upper_iqr, color='gray', alpha=0.4, label='IQR (25%-75%)', rasterized=True)
+    ax1.fill_between(data['Date'], lower_p_threshold, upper_p_threshold, color='gray', alpha=0.2, label='95th percentile of random', rasterized=True)
 
 # add vertical dashed lines with legend
 for idx, date in enumerate(['25.01.2024', '21.03.2024']):
@@ -134,6 +178,11 @@ for idx, date in enumerate(['25.01.2024', '21.03.2024']):
 
 # set custom y-axis limits
 ax1.set_ylim(Y_AXIS_MIN, Y_AXIS_MAX)
+
+# plot the random replicates as one image under the other layers, rasterised inside the SVG at RASTER_DPI
+if SHOW_REPLICATES:
+    add_replicate_lines(ax1, mdates.date2num(data['Date']), random_data.to_numpy().T, REPLICATE_LINE_COLOR,
+                        REPLICATE_LINE_WIDTH, REPLICATE_LINE_ALPHA, raster_dpi=RASTER_DPI, zorder=0)
 #ax2.set_ylim(SECONDARY_Y_AXIS_MIN, SECONDARY_Y_AXIS_MAX)
 
 # add plot details
@@ -158,8 +207,7 @@ ax1.grid(alpha=0.3)
 
 plt.tight_layout()
 
-# save the figure
-plt.savefig('Fig3_B_v2.svg', format='svg')
-plt.savefig('Fig3_B_v2.png', format='png')
+# save the figure in every format
+save_formats(fig, 'Fig3_B_v2', OUTPUT_FORMATS, RASTER_DPI, PNG_DPI)
 
 plt.show()
@@ -0,0 +1,150 @@
+import sys
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.stats import barnard_exact, boschloo_exact, fisher_exact, hypergeom
+
+# largest table total (a + b + c + d) held in the lookup table
+LOOKUP_MAX_TOTAL = 50
+
+# tests that can be looked up
+LOOKUP_METHODS = ['barnard', 'boschloo', 'midp']
+
+# grid points of the nuisance parameter used by scipy's Barnard and Boschloo tests
+SAMPLING_POINTS = 32
+
+# relative tolerance for ties between table probabilities (same as scipy's fisher_exact)
+RELATIVE_TOLERANCE = 1 + 1e-7
+
+# table layout (same as FET_v4.py): the columns are the arms, so n1 = a + c and n2 = b + d are fixed
+#         Inside Zone    Outside Zone
+# treatment   a                c
+# control     b                d
+# contingency_table = [[a, b], [c, d]]
+
+# two-sided Fisher mid-p for every table with column totals n1 and n2, as an (n1 + 1, n2 + 1) array indexed by (a, b)
+def midp_for_totals(n1, n2):
+    pvalues = np.ones((n1 + 1, n2 + 1))
+    for inside in range(n1 + n2 + 1):
+        # a follows a hypergeometric distribution given the number of cases inside a zone
+        support = np.arange(max(0, inside - n2), min(n1, inside) + 1)
+        # a single possible table (an empty arm, or everyone inside or outside) carries no information (p = 1)
+        if len(support) == 1:
+            continue
+        pmf = hypergeom.pmf(support, n1 + n2, inside, n1)
+        for a, p_obs in zip(support, pmf):
+            more_extreme = pmf[pmf < p_obs / RELATIVE_TOLERANCE].sum()
+            as_extreme = pmf[np.abs(pmf - p_obs) <= p_obs * (RELATIVE_TOLERANCE - 1)].sum()
+            pvalues[a, inside - a] = min(1.0, more_extreme + 0.5 * as_extreme)
+    return pvalues
+
+# two-sided unconditional p-value of every table with column totals n1 and n2
+def unconditional_for_totals(method, n1, n2):
+    test = barnard_exact if method == 'barnard' else boschloo_exact
+    pvalues = np.ones((n1 + 1, n2 + 1))
+    for a in range(n1 + 1):
+        for b in range(n2 + 1):
+            # tables with an empty row carry no information (p = 1)
+            if a + b == 0 or (n1 - a) + (n2 - b) == 0:
+                continue
+            table = np.array([[a, b], [n1 - a, n2 - b]])
+            pvalues[a, b] = test(table, alternative='two-sided', n=SAMPLING_POINTS).pvalue
+    return pvalues
+
+def _totals_job(args):
+    method, n1, n2 = args
+    if method == 'midp':
+        return n1, n2, midp_for_totals(n1, n2)
+    return n1, n2, unconditional_for_totals(method, n1, n2)
+
+# start of the (a, b) block of every pair of column totals 1 <= n1 <= n2 with n1 + n2 <= max_total in the flat lookup
+# (-1 elsewhere), and the number of entries
+def lookup_offsets(max_total):
+    offsets = np.full((max_total + 1, max_total + 1), -1, dtype=np.int64)
+    size = 0
+    for n1 in range(1, max_total // 2 + 1):
+        for n2 in range(n1, max_total + 1 - n1):
+            offsets[n1, n2] = size
+            size += (n1 + 1) * (n2 + 1)
+    return offsets, size
+
+# sidecar file recording the test and largest table total of a lookup (the .npy itself stays memory-mappable)
+def lookup_info_file(lookup_file):
+    return f'{lookup_file}.json'
+
+# build the flat lookup of every valid p[n1, n2, a, b] on disk, spreading the column totals over worker processes
+def build_lookup(method, output_file, max_total=LOOKUP_MAX_TOTAL, max_workers=None):
+    offsets, size = lookup_offsets(max_total)
+    lookup = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.float64, shape=(size,))
+
+    # swapping the arms gives the same two-sided p-value, so only n1 <= n2 is computed and stored
+    jobs = [(method, n1, n2) for n1 in range(1, max_total) for n2 in range(n1, max_total + 1 - n1)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_totals_job, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            n1, n2, pvalues = future.result()
+            lookup[offsets[n1, n2]:offsets[n1, n2] + pvalues.size] = pvalues.ravel()
+            if done % 100 == 0 or done == len(futures):
+                print(f"{method}: {done}/{len(futures)} column totals done")
+    lookup.flush()
+    with open(lookup_info_file(output_file), 'w') as f:
+        json.dump({'method': method, 'max_total': max_total}, f)
+    return lookup
+
+# memory-map a lookup built by build_lookup, checking that it holds the expected test (if method is given)
+def load_lookup(lookup_file, method=None):
+    try:
+        with open(lookup_info_file(lookup_file)) as f:
+            info = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"{lookup_file} has no {lookup_info_file(lookup_file)}, so its test is unknown; rebuild it.")
+    if method is not None and info['method'] != method:
+        raise ValueError(f"{lookup_file} holds {info['method']} p-values, not {method}.")
+
+    pvalues = np.load(lookup_file, mmap_mode='r')
+    offsets, size = lookup_offsets(info['max_total'])
+    if size != len(pvalues):
+        raise ValueError(f"{lookup_file} does not match a lookup for tables up to N = {info['max_total']}; rebuild it.")
+    return {'pvalues': pvalues, 'offsets': offsets, 'max_total': info['max_total'], 'method': info['method']}
+
+# p-value of one table computed directly, for tables beyond the lookup
+def direct_pvalue(method, a, b, c, d):
+    table = np.array([[a, b], [c, d]])
+    if method == 'fisher':
+        return fisher_exact(table)[1]
+    if method == 'midp':
+        return midp_for_totals(a + c, b + d)[a, b]
+    test = barnard_exact if method == 'barnard' else boschloo_exact
+    return test(table, alternative='two-sided', n=SAMPLING_POINTS).pvalue
+
+# p-values of many tables (a, b, c, d arrays) by lookup, with a direct calculation for tables too large for the lookup
+def lookup_pvalues(method, lookup, a, b, c, d):
+    if lookup['method'] != method:
+        raise ValueError(f"The lookup holds {lookup['method']} p-values, not {method}.")
+    a, b, c, d = (np.asarray(v, dtype=int) for v in (a, b, c, d))
+    n1 = a + c
+    n2 = b + d
+    in_lookup = (n1 + n2 <= lookup['max_total']) & (n1 > 0) & (n2 > 0)
+
+    # arms swapped where needed so that n1 <= n2, as stored
+    swap = n1 > n2
+    m1, m2 = np.where(swap, n2, n1)[in_lookup], np.where(swap, n1, n2)[in_lookup]
+    x, y = np.where(swap, b, a)[in_lookup], np.where(swap, a, b)[in_lookup]
+
+    pvalues = np.full(a.shape, np.nan)
+    pvalues[in_lookup] = lookup['pvalues'][lookup['offsets'][m1, m2] + x * (m2 + 1) + y]
+    for i in np.flatnonzero(~in_lookup | np.isnan(pvalues)):
+        pvalues.flat[i] = direct_pvalue(method, a.flat[i], b.flat[i], c.flat[i], d.flat[i])
+    return pvalues
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or sys.argv[1] not in LOOKUP_METHODS:
+        print("Usage: python unconditional_exact_lookup_v1.py <barnard|boschloo|midp> <output_npy> [max_total]")
+        sys.exit(1)
+
+    method = sys.argv[1]
+    output_file = sys.argv[2]
+    max_total = int(sys.argv[3]) if len(sys.argv) == 4 else LOOKUP_MAX_TOTAL
+
+    build_lookup(method, output_file, max_total)
+    print(f"{method} lookup for tables up to N = {max_total} -> {output_file}")
@@ -0,0 +1,114 @@
+import sys
+import numpy as np
+import pandas as pd
+from FET_v4 import ZONE_RADIUS_KM, GEODESIC_TOLERANCE, raster_shape, spherical_distances, classify_cases
+
+# area covered by the lookup grid (min_lon, max_lon, min_lat, max_lat); cases outside it use the exact distances
+ZONE_GRID_BBOX = (144.86, 144.986887, -37.785, -37.714593)
+
+# grid cell size (m)
+ZONE_GRID_CELL_M = 5
+
+# grid rows computed at a time while building
+BUILD_CHUNK_ROWS = 64
+
+# nearest arm, inside-zone flag and a conservative distance (m) to the nearest classification boundary for every cell
+def build_zone_grid(treatment_coords, control_coords, bbox=ZONE_GRID_BBOX, cell_m=ZONE_GRID_CELL_M, radius_km=ZONE_RADIUS_KM):
+    min_lon, max_lon, min_lat, max_lat = bbox
+    ny, nx, cell_lat, cell_lon = raster_shape(bbox, cell_m)
+    centre_lons = min_lon + (np.arange(nx) + 0.5) * cell_lon
+
+    nearest_arm = np.zeros((ny, nx), dtype=np.int8)
+    inside = np.zeros((ny, nx), dtype=np.int8)
+    boundary_m = np.zeros((ny, nx), dtype=np.float32)
+
+    for row in range(0, ny, BUILD_CHUNK_ROWS):
+        rows = np.arange(row, min(row + BUILD_CHUNK_ROWS, ny))
+        centre_lats = min_lat + (rows + 0.5) * cell_lat
+        lat_grid, lon_grid = np.meshgrid(centre_lats, centre_lons, indexing='ij')
+        coords = np.column_stack([lat_grid.ravel(), lon_grid.ravel()])
+
+        d_treatment = spherical_distances(coords, treatment_coords).min(axis=1)
+        d_control = spherical_distances(coords, control_coords).min(axis=1)
+        nearest_treatment = d_treatment < d_control
+        d_nearest = np.where(nearest_treatment, d_treatment, d_control)
+
+        # margins shrunk by the worst case spherical error, so the exact geodesic result cannot differ inside them
+        zone_margin = np.abs(d_nearest - radius_km) - GEODESIC_TOLERANCE * d_nearest
+        tie_margin = (np.abs(d_treatment - d_control) - GEODESIC_TOLERANCE * (d_treatment + d_control)) / 2
+
+        shape = (len(rows), nx)
+        nearest_arm[rows] = nearest_treatment.reshape(shape)
+        inside[rows] = (d_nearest <= radius_km).reshape(shape)
+        boundary_m[rows] = (1000 * np.minimum(zone_margin, tie_margin)).reshape(shape)
+
+    return {
+        'nearest_arm': nearest_arm,
+        'inside': inside,
+        'boundary_m': boundary_m,
+        'bbox': np.asarray(bbox, dtype=float),
+        'cell_m': float(cell_m),
+        'radius_km': float(radius_km),
+        'treatment_coords': np.asarray(treatment_coords, dtype=float),
+        'control_coords': np.asarray(control_coords, dtype=float),
+    }
+
+def save_zone_grid(zone_grid, output_file):
+    np.savez(output_file, **zone_grid)
+
+# load a grid and check it was built for this site layout and zone radius
+def load_zone_grid(grid_file, treatment_coords, control_coords):
+    with np.load(grid_file) as stored:
+        zone_grid = {key: stored[key] for key in stored.files}
+
+    same_layout = (zone_grid['treatment_coords'].shape == np.shape(treatment_coords)
+                   and zone_grid['control_coords'].shape == np.shape(control_coords)
+                   and np.allclose(zone_grid['treatment_coords'], treatment_coords)
+                   and np.allclose(zone_grid['control_coords'], control_coords))
+    if not same_layout or not np.isclose(zone_grid['radius_km'], ZONE_RADIUS_KM):
+        raise ValueError(f"{grid_file} was built for a different site layout or zone radius; rebuild it.")
+    return zone_grid
+
+# classify cases by indexing the grid; cases outside it or in cells near a boundary get the exact distances
+def classify_with_grid(zone_grid, case_coords, treatment_coords, control_coords):
+    case_coords = np.asarray(case_coords, dtype=float)
+    min_lon, max_lon, min_lat, max_lat = zone_grid['bbox']
+    cell_m = float(zone_grid['cell_m'])
+    ny, nx, cell_lat, cell_lon = raster_shape(tuple(zone_grid['bbox']), cell_m)
+
+    row = np.floor((case_coords[:, 0] - min_lat) / cell_lat).astype(int)
+    col = np.floor((case_coords[:, 1] - min_lon) / cell_lon).astype(int)
+    in_grid = (row >= 0) & (row < ny) & (col >= 0) & (col < nx)
+    row = np.where(in_grid, row, 0)
+    col = np.where(in_grid, col, 0)
+
+    # a case is at most half a cell diagonal from its cell centre
+    half_diagonal_m = cell_m * np.sqrt(2) / 2
+    resolved = in_grid & (zone_grid['boundary_m'][row, col] > half_diagonal_m)
+
+    nearest_treatment = zone_grid['nearest_arm'][row, col].astype(bool)
+    within_zone = zone_grid['inside'][row, col].astype(bool)
+
+    fallback = np.flatnonzero(~resolved)
+    if fallback.size:
+        exact_nearest, exact_within = classify_cases(case_coords[fallback], treatment_coords, control_coords)
+        nearest_treatment[fallback] = exact_nearest
+        within_zone[fallback] = exact_within
+    return nearest_treatment, within_zone
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        print("Usage: python zone_lookup_grid_v1.py <treatment_sites_file> <control_sites_file> <output_npz>")
+        sys.exit(1)
+
+    treatment_sites = pd.read_csv(sys.argv[1])
+    control_sites = pd.read_csv(sys.argv[2])
+    output_file = sys.argv[3]
+
+    zone_grid = build_zone_grid(treatment_sites[['lat', 'lon']].to_numpy(), control_sites[['lat', 'lon']].to_numpy())
+    save_zone_grid(zone_grid, output_file)
+
+    half_diagonal_m = ZONE_GRID_CELL_M * np.sqrt(2) / 2
+    exact_share = np.mean(zone_grid['boundary_m'] <= half_diagonal_m)
+    print(f"Zone grid of {zone_grid['inside'].shape[0]} x {zone_grid['inside'].shape[1]} cells "
+          f"({100 * exact_share:.2f}% near a boundary) -> {output_file}")